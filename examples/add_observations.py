@@ -15,8 +15,11 @@ import logging
 import sys
 import random
 from datetime import datetime, timedelta
+import numpy as np
 import pysc.models
 from examples.util import setup_sensorcloud_basic, datetime_to_iso
+from examples.ingest import ingest, read_csv_results
+from examples.observation_builder import ObservationBuilder
 
 MODULE = sys.modules[__name__]
 CONSTS = MODULE.CONSTS = dict()
@@ -30,6 +33,12 @@ CONSTS['PYSC_DEBUG'] = True
 # Define some constants we will use for this example
 # Note, adding observations to stream is one of the only things for which we don't need to include our organisation_id.
 CONSTS['STREAM_ID'] = "my.stream.1"  # This is the id of the stream that will be created in the organisation.
+# Set CSV_FILE to the path of a CSV file of "time,value" rows to upload the whole file in batches instead.
+# This works for files of any size, the file is read lazily and only a few batches are held in memory at once.
+CONSTS['CSV_FILE'] = None
+# Set BACKFILL_HOURS to a number of hours to generate that many hourly results as NumPy arrays instead, and upload them
+# with an ObservationBuilder, which encodes the upload straight from the arrays.
+CONSTS['BACKFILL_HOURS'] = 0
 # Set up logging for this example file
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -53,6 +62,23 @@ def main():
         raise RuntimeWarning("""The stream named {:s} was not found.""".format(stream_id))
     # Ensure sanity, check we got the stream that we asked for.
     assert (stream.id == stream.id)
+
+    if CONSTS['CSV_FILE']:
+        # Upload the file in batches, with a few batches in flight at once. Failed batches are retried on their own.
+        report = ingest(stream, read_csv_results(CONSTS['CSV_FILE']),
+                        progress=lambda r: logger.info(str(r)))
+        print(str(report))
+        return
+
+    if CONSTS['BACKFILL_HOURS']:
+        hours = CONSTS['BACKFILL_HOURS']
+        builder = ObservationBuilder(stream.id, capacity=hours)
+        starting_time = np.datetime64(datetime.utcnow().replace(minute=0, second=0, microsecond=0), 'us')
+        builder.extend(starting_time - np.arange(hours, 0, -1) * np.timedelta64(1, 'h'),
+                       np.random.random(hours) * 10.0)
+        print("Uploaded {:d} results.".format(builder.save()))
+        return
+
     generated_results = []
     obs = pysc.models.Observation(None, stream=stream)  # The None just means we are creating a new observation
     # The following block just generates a chunk of 100 hourly observation results
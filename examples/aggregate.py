@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming aggregation (downsampling) of observation results into fixed time buckets, eg. hourly or daily
+count, min, max and mean.
+
+`BucketAggregator` consumes observation results one page at a time, as columnar NumPy arrays, and reduces each page
+with vectorised NumPy operations. Only the one bucket still open at the end of the latest page is carried over to the
+next page, every other bucket is complete and is handed back straight away, so a stream with years of raw results can
+be summarised in constant memory.
+
+The bucket interval is checked against the stream's `sample_period`, and defaults to its `reporting_period`, see
+`stream_interval()`.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import re
+from datetime import datetime, timedelta
+import numpy as np
+from examples.columnar import TIME_DTYPE, VALUE_DTYPE, page_to_arrays
+from examples.observations import iter_observation_pages, DEFAULT_CHUNK_SIZE
+
+# One row per bucket. `start` is the start of the bucket, the bucket covers [start, start + interval).
+AGGREGATE_DTYPE = np.dtype([('start', TIME_DTYPE), ('count', 'int64'), ('min', VALUE_DTYPE), ('max', VALUE_DTYPE),
+                            ('mean', VALUE_DTYPE)])
+EPOCH = datetime(1970, 1, 1)
+
+_DURATION_RE = re.compile(r'^P(?:(?P<weeks>\d+(?:\.\d+)?)W)?(?:(?P<days>\d+(?:\.\d+)?)D)?'
+                          r'(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?'
+                          r'(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$')
+
+
+def parse_duration(duration):
+    """
+    Parse an ISO8601 duration with a fixed length, like the `reporting_period` and `sample_period` of a stream.
+    :param duration: str, eg. 'PT1H', 'PT15M', 'P1D', 'P1W', or a timedelta which is returned as is
+    :return: timedelta
+    :raises ValueError: for an invalid duration, or one measured in months or years, which don't have a fixed length
+    """
+    if isinstance(duration, timedelta):
+        return duration
+    match = _DURATION_RE.match(duration.strip().upper()) if duration else None
+    if match is None or duration.strip().upper() in ("P", "PT"):
+        raise ValueError("Not a fixed length ISO8601 duration: {:s}".format(repr(duration)))
+    parts = {k: float(v) for k, v in match.groupdict().items() if v is not None}
+    return timedelta(**parts)
+
+
+def stream_interval(stream, interval=None):
+    """
+    Choose the bucket interval for aggregating a stream.
+    :param stream: a `pysc.models.Stream`
+    :param interval: the requested interval, an ISO8601 duration string or a timedelta. Defaults to the stream's
+                     reporting_period (or sample_period).
+    :return: timedelta
+    :raises ValueError: if the interval is shorter than the stream's sample_period, so the buckets would be emptier
+                        than the data itself
+    """
+    sample_period = getattr(stream, 'sample_period', None)
+    sample = parse_duration(sample_period) if sample_period else None
+    if interval is None:
+        interval = getattr(stream, 'reporting_period', None) or sample_period
+        if interval is None:
+            raise ValueError("Stream {:s} has no reporting_period or sample_period, give an interval."
+                             .format(str(getattr(stream, 'id', stream))))
+    interval = parse_duration(interval)
+    if sample is not None and interval < sample:
+        raise ValueError("The interval {:s} is shorter than the sample_period {:s} of the stream."
+                         .format(str(interval), str(sample)))
+    return interval
+
+
+class BucketAggregator(object):
+    """
+    Incremental count, min, max and mean of observation values in fixed time buckets.
+    Pages must be added in time order (as `iter_observation_pages()` returns them), results within a page may be in
+    any order. NaN values are ignored. Empty buckets are not emitted.
+    """
+
+    def __init__(self, interval, origin=EPOCH):
+        """
+        :param interval: the bucket length, an ISO8601 duration string or a timedelta
+        :param origin: datetime the buckets are aligned to, defaults to midnight UTC on 1970-01-01
+        """
+        interval = parse_duration(interval)
+        step = int(interval // timedelta(microseconds=1))
+        if step <= 0:
+            raise ValueError("The bucket interval must be positive.")
+        self.interval = interval
+        self._step = np.timedelta64(step, 'us')
+        self._origin = np.datetime64(origin, 'us')
+        self._open = None  # (bucket index, count, min, max, sum) of the bucket still being filled
+        self.results = 0  # the number of values aggregated so far
+
+    def _rows(self, keys, counts, mins, maxs, sums):
+        rows = np.empty(len(keys), dtype=AGGREGATE_DTYPE)
+        rows['start'] = self._origin + keys * self._step
+        rows['count'] = counts
+        rows['min'] = mins
+        rows['max'] = maxs
+        rows['mean'] = sums / counts
+        return rows
+
+    def add(self, times, values):
+        """
+        Add a page of results.
+        :param times: array-like of datetime64[us]
+        :param values: array-like of float64
+        :return: structured array (AGGREGATE_DTYPE) of the buckets completed by this page, possibly empty
+        :raises ValueError: if the page has results before the bucket which is still open
+        """
+        times = np.asarray(times, dtype=TIME_DTYPE)
+        values = np.asarray(values, dtype=VALUE_DTYPE)
+        if len(times) != len(values):
+            raise ValueError("times and values must be the same length.")
+        keep = ~np.isnan(values)
+        if not keep.all():
+            times, values = times[keep], values[keep]
+        if not len(times):
+            return np.empty(0, dtype=AGGREGATE_DTYPE)
+        index = (times - self._origin) // self._step
+        if np.any(index[1:] < index[:-1]):
+            order = np.argsort(index, kind='mergesort')
+            index, values = index[order], values[order]
+        if self._open is not None and index[0] < self._open[0]:
+            raise ValueError("Results must be added in time order, got a result for a bucket which is already closed.")
+
+        # Reduce each run of equal bucket indexes in one pass
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+        keys = index[starts]
+        counts = np.diff(np.append(starts, len(index)))
+        mins = np.minimum.reduceat(values, starts)
+        maxs = np.maximum.reduceat(values, starts)
+        sums = np.add.reduceat(values, starts)
+        self.results += len(values)
+
+        if self._open is not None:
+            key, count, low, high, total = self._open
+            if keys[0] == key:
+                counts[0] += count
+                mins[0] = min(mins[0], low)
+                maxs[0] = max(maxs[0], high)
+                sums[0] += total
+            else:
+                keys = np.concatenate(([key], keys))
+                counts = np.concatenate(([count], counts))
+                mins = np.concatenate(([low], mins))
+                maxs = np.concatenate(([high], maxs))
+                sums = np.concatenate(([total], sums))
+        # The last bucket may continue in the next page, keep it open
+        self._open = (keys[-1], counts[-1], mins[-1], maxs[-1], sums[-1])
+        return self._rows(keys[:-1], counts[:-1], mins[:-1], maxs[:-1], sums[:-1])
+
+    def flush(self):
+        """
+        Close the open bucket, at the end of the data.
+        :return: structured array (AGGREGATE_DTYPE) holding the last bucket, or empty if there was no data
+        """
+        if self._open is None:
+            return np.empty(0, dtype=AGGREGATE_DTYPE)
+        key, count, low, high, total = self._open
+        self._open = None
+        return self._rows(np.array([key]), np.array([count]), np.array([low]), np.array([high]), np.array([total]))
+
+
+def iter_aggregates(stream, interval=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE, origin=EPOCH):
+    """
+    Generator over the aggregated buckets of a stream, in time order, reading the raw results a page at a time.
+    :param stream: a `pysc.models.Stream`
+    :param interval: the bucket length, see `stream_interval()`
+    :param start: datetime, read results at or after this time, defaults to the start of the stream
+    :param end: datetime, stop reading at this time (inclusive), defaults to the end of the stream
+    :param chunk_size: the maximum number of results to request per page, or an AdaptivePageSize
+    :param origin: datetime the buckets are aligned to
+    :return: generator of structured arrays (AGGREGATE_DTYPE), one per page that completed any buckets
+    """
+    aggregator = BucketAggregator(stream_interval(stream, interval), origin)
+    for page in iter_observation_pages(stream, start, end, chunk_size):
+        rows = aggregator.add(*page_to_arrays(page))
+        if len(rows):
+            yield rows
+    rows = aggregator.flush()
+    if len(rows):
+        yield rows
+
+
+def aggregate(stream, interval=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE, origin=EPOCH):
+    """
+    Aggregate a stream into one array of buckets. Memory use grows with the number of buckets, not the number of
+    results. See `iter_aggregates()` for the parameters.
+    :return: structured array (AGGREGATE_DTYPE)
+    """
+    chunks = list(iter_aggregates(stream, interval, start, end, chunk_size, origin))
+    if not chunks:
+        return np.empty(0, dtype=AGGREGATE_DTYPE)
+    return np.concatenate(chunks)
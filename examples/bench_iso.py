@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark comparing the timestamp codec in `examples.util` against the original strptime/strftime functions.
+
+This doesn't need a SensorCloud endpoint, just run it:
+python3 -m examples.bench_iso
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from examples.util import ISO_FORMAT, datetime_to_iso, datetime_from_iso, datetimes_to_iso, datetimes_from_iso
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+CONSTS['COUNT'] = 100000  # The number of timestamps in each batch
+CONSTS['REPEAT'] = 5  # Take the best of this many runs
+
+
+def strftime_to_iso(_d):
+    # The original implementation from examples.util
+    return _d.strftime(ISO_FORMAT)
+
+
+def strptime_from_iso(_d):
+    # The original implementation from examples.util
+    return datetime.strptime(_d, ISO_FORMAT)
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, seconds, count):
+    print("{:<36s} {:10.4f} s {:12,.0f} timestamps/s".format(name, seconds, count / seconds))
+
+
+def main():
+    """
+    Entrypoint for this benchmark
+    :return:
+    """
+    count = CONSTS['COUNT']
+    repeat = CONSTS['REPEAT']
+    start = datetime(2017, 1, 1)
+    datetimes = [start + timedelta(seconds=i, microseconds=i) for i in range(count)]
+    strings = [strftime_to_iso(d) for d in datetimes]
+    # Sanity check, the new codec must agree with the original one.
+    assert [datetime_to_iso(d) for d in datetimes] == strings
+    assert [datetime_from_iso(s) for s in strings] == datetimes
+
+    print("Encoding {:d} timestamps:".format(count))
+    report("strftime (original)", best_of(lambda: [strftime_to_iso(d) for d in datetimes], repeat), count)
+    report("datetime_to_iso", best_of(lambda: [datetime_to_iso(d) for d in datetimes], repeat), count)
+    report("datetimes_to_iso (list)", best_of(lambda: datetimes_to_iso(datetimes), repeat), count)
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        array = np.array(datetimes, dtype='datetime64[us]')
+        report("datetimes_to_iso (numpy)", best_of(lambda: datetimes_to_iso(array), repeat), count)
+
+    print("Decoding {:d} timestamps:".format(count))
+    report("strptime (original)", best_of(lambda: [strptime_from_iso(s) for s in strings], repeat), count)
+    report("datetime_from_iso", best_of(lambda: [datetime_from_iso(s) for s in strings], repeat), count)
+    report("datetimes_from_iso (list)", best_of(lambda: datetimes_from_iso(strings), repeat), count)
+    if np is not None:
+        report("datetimes_from_iso (numpy)", best_of(lambda: datetimes_from_iso(strings, as_numpy=True), repeat),
+               count)
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
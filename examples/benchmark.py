@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the example workflows, run against the local SensorCloud stand-in in local_server.py.
+
+Each workflow is the `main()` of one of the examples, pointed at the local server. For each one this reports the
+number of requests made, requests per second, p50 and p99 request latency (as measured by the server) and the peak
+Python memory allocated by the example while it ran.
+The server runs in a separate process with a configurable latency per request, so the numbers are repeatable and
+can be compared between changes, without needing a live SensorCloud instance.
+
+python3 -m examples.benchmark
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import contextlib
+import importlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlsplit, urlunsplit
+import requests
+from examples.local_server import start_process, CONTROL_PREFIX
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+CONSTS['LATENCY'] = 0.01  # seconds of simulated latency the server adds to every request
+CONSTS['STREAMS'] = 200  # the number of streams seeded on the server
+CONSTS['OBSERVATIONS'] = 5000  # the number of observations seeded into each stream
+CONSTS['PAGE_SIZE'] = 100  # the page size of the server's stream and group indexes
+CONSTS['REPEAT'] = 3  # the number of times to run each workflow, the best run is reported
+CONSTS['JSON_OUTPUT'] = None  # set to a filename to also write the results as JSON
+
+# (name, example module, extra CONSTS for the example). The order matters, delete_group deletes the group that
+# create_group created.
+WORKFLOWS = [
+    ("get_streams", "examples.get_streams", {}),
+    ("get_groups", "examples.get_groups", {}),
+    ("create_group", "examples.create_group", {'NEW_GROUP': "mygroup"}),
+    ("delete_group", "examples.delete_group", {'GROUP_ID': "mygroup"}),
+    ("create_stream", "examples.create_stream", {'NEW_STREAM_ID': "my.new.stream"}),
+    ("add_observations", "examples.add_observations", {'STREAM_ID': "my.stream.1"}),
+    ("get_observations_from_stream", "examples.get_observations_from_stream", {'STREAM_ID': "my.stream.1"}),
+]
+
+
+def percentile(values, p):
+    """
+    :param values: list of numbers
+    :param p: the percentile, between 0 and 100
+    :return: the nearest-rank percentile of the values, or 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Benchmark(object):
+    """
+    Runs example workflows against a local server, and collects their measurements.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        parts = urlsplit(endpoint)
+        self._control = urlunsplit(parts[:2] + (CONTROL_PREFIX, '', ''))
+        self._session = requests.Session()
+
+    def _server_stats(self):
+        return self._session.get(self._control + "/stats").json()
+
+    def _reset_server_stats(self):
+        self._session.post(self._control + "/reset", json={}).raise_for_status()
+
+    def _prepare(self, name):
+        # delete_group needs its group to exist on every run, not just the first one
+        if name == "delete_group":
+            self._session.put(self.endpoint + "/groups/mygroup",
+                              json={"id": "mygroup", "name": "mygroup", "description": "Benchmark group",
+                                    "organisationid": "csiro"}).raise_for_status()
+
+    def run_once(self, name, module_name, consts):
+        module = importlib.import_module(module_name)
+        module.CONSTS['SC_ENDPOINT'] = self.endpoint
+        module.CONSTS['PYSC_DEBUG'] = False
+        module.CONSTS.update(consts)
+        self._prepare(name)
+        self._reset_server_stats()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                module.main()
+        finally:
+            wall = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats = self._server_stats()
+        durations = stats['durations']
+        return {
+            "workflow": name,
+            "requests": stats['requests'],
+            "errors": stats['errors'],
+            "bytes_received": stats['bytes_sent'],
+            "wall_s": wall,
+            "requests_per_s": stats['requests'] / wall if wall > 0 else 0.0,
+            "p50_ms": percentile(durations, 50) * 1000.0,
+            "p99_ms": percentile(durations, 99) * 1000.0,
+            "peak_memory_mb": peak / (1024.0 * 1024.0),
+        }
+
+    def run(self, workflows, repeat=1):
+        results = []
+        for name, module_name, consts in workflows:
+            runs = [self.run_once(name, module_name, consts) for _ in range(repeat)]
+            results.append(min(runs, key=lambda r: r['wall_s']))
+        return results
+
+
+def print_results(results):
+    print("{:<30s} {:>8s} {:>9s} {:>10s} {:>9s} {:>9s} {:>10s}".format(
+        "workflow", "requests", "wall s", "req/s", "p50 ms", "p99 ms", "peak MB"))
+    for r in results:
+        print("{workflow:<30s} {requests:>8d} {wall_s:>9.3f} {requests_per_s:>10.1f} {p50_ms:>9.2f} {p99_ms:>9.2f} "
+              "{peak_memory_mb:>10.2f}".format(**r))
+
+
+def main():
+    """
+    Entrypoint for the benchmark
+    :return:
+    """
+    process, endpoint = start_process(latency=CONSTS['LATENCY'], page_size=CONSTS['PAGE_SIZE'],
+                                      streams=CONSTS['STREAMS'], observations=CONSTS['OBSERVATIONS'])
+    try:
+        results = Benchmark(endpoint).run(WORKFLOWS, repeat=CONSTS['REPEAT'])
+    finally:
+        process.terminate()
+        process.join()
+    print_results(results)
+    if CONSTS['JSON_OUTPUT']:
+        with open(CONSTS['JSON_OUTPUT'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
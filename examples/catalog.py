@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+A local catalog of SensorCloud metadata (organisations, locations, groups and streams), stored in an SQLite database.
+
+Questions like "which streams at location X measure soil moisture" otherwise need a crawl of `Stream.index()` and a
+request per stream, like the get_streams.py example. The catalog keeps a copy of every entity document, and indexes
+streams on `organisation_id`, `location_id`, `observed_property`, `unit_of_measure`, `result_type` and group, so those
+questions are answered from the local database in milliseconds.
+
+`refresh()` brings the catalog up to date incrementally. It reads the index pages of each collection, which only hold
+links, then fetches the entities which are new, drops the ones which are gone, and revalidates the ones it has not
+checked for `max_age` seconds with a conditional `If-None-Match` request, so unchanged entities cost a 304 with no
+body. The requests are made on the shared session, see examples.util.require_session(). The database lock is only
+held while the results are written, so queries are not held up by a refresh.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, unquote
+from examples.util import require_session, get_endpoint
+
+KINDS = ('locations', 'groups', 'streams')  # the collections indexed by organisation, refreshed in this order
+DEFAULT_MAX_AGE = 3600.0  # seconds before a cached entity is revalidated
+DEFAULT_MAX_WORKERS = 8
+STREAM_FILTERS = ('organisation_id', 'location_id', 'observed_property', 'unit_of_measure', 'result_type', 'group_id')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    organisation_id TEXT,
+    url TEXT NOT NULL,
+    etag TEXT,
+    checked REAL NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entities_organisation ON entities (kind, organisation_id);
+CREATE TABLE IF NOT EXISTS streams (
+    id TEXT PRIMARY KEY NOT NULL,
+    organisation_id TEXT,
+    location_id TEXT,
+    observed_property TEXT,
+    unit_of_measure TEXT,
+    result_type TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS streams_organisation ON streams (organisation_id);
+CREATE INDEX IF NOT EXISTS streams_location ON streams (location_id);
+CREATE INDEX IF NOT EXISTS streams_observed_property ON streams (observed_property);
+CREATE INDEX IF NOT EXISTS streams_unit_of_measure ON streams (unit_of_measure);
+CREATE INDEX IF NOT EXISTS streams_result_type ON streams (result_type);
+CREATE TABLE IF NOT EXISTS stream_groups (
+    stream_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    PRIMARY KEY (stream_id, group_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stream_groups_group ON stream_groups (group_id);
+"""
+
+
+def _first(doc, *keys):
+    # SensorCloud documents use camelCase keys (eg. 'organisationid'), `pysc` uses snake_case, accept both
+    for k in keys:
+        v = doc.get(k)
+        if v is not None:
+            return v
+    return None
+
+
+def _organisation_of(doc):
+    return _first(doc, 'organisationid', 'organisation_id', 'organisationId')
+
+
+def _stream_row(doc):
+    metadata = _first(doc, 'streamMetadata', 'stream_metadata') or {}
+    return (doc['id'], _organisation_of(doc), _first(doc, 'locationid', 'location_id', 'locationId'),
+            _first(metadata, 'observedProperty', 'observed_property'),
+            _first(metadata, 'unitOfMeasure', 'unit_of_measure'),
+            _first(doc, 'resultType', 'result_type'))
+
+
+def _stream_groups(doc):
+    return _first(doc, 'groupids', 'group_ids', 'groupIds') or []
+
+
+def _link_urls(doc, rel, base):
+    links = (doc.get('_links') or {}).get(rel) or []
+    if isinstance(links, dict):
+        links = [links]
+    return [urljoin(base, l['href']) for l in links]
+
+
+class StreamCatalog(object):
+    """
+    An on-disk, indexed catalog of SensorCloud metadata.
+    Can be used as a context manager, to close the database when done.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the filename of the SQLite database, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _index_urls(self, kind, org_id):
+        # Only the links on each index page are read, not the entities themselves
+        session = require_session()
+        url = "{:s}/{:s}".format(get_endpoint(), kind)
+        params = {'organisation_id': org_id}
+        urls = {}
+        while url:
+            response = session.get(url, params=params)
+            response.raise_for_status()
+            doc = response.json()
+            for entity_url in _link_urls(doc, kind, response.url):
+                urls[unquote(entity_url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1])] = entity_url
+            next_urls = _link_urls(doc, 'next', response.url)
+            url = next_urls[0] if next_urls else None
+            params = None  # the next link already carries the query
+        return urls
+
+    def _fetch(self, url, etag):
+        headers = {'If-None-Match': etag} if etag else None
+        response = require_session().get(url, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.json(), response.headers.get('ETag')
+
+    def _known(self, kind, org_id):
+        with self._lock:
+            rows = self._db.execute("SELECT id, etag, checked, doc FROM entities "
+                                    "WHERE kind = ? AND organisation_id = ?", (kind, org_id)).fetchall()
+        return {r[0]: r[1:] for r in rows}
+
+    def _store(self, kind, entity_id, url, etag, doc, now):
+        org_id = _organisation_of(doc) if kind != 'organisations' else entity_id
+        self._db.execute("INSERT OR REPLACE INTO entities (kind, id, organisation_id, url, etag, checked, doc) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (kind, entity_id, org_id, url, etag, now, json.dumps(doc, sort_keys=True)))
+        if kind == 'streams':
+            self._db.execute("INSERT OR REPLACE INTO streams (id, organisation_id, location_id, observed_property, "
+                             "unit_of_measure, result_type) VALUES (?, ?, ?, ?, ?, ?)", _stream_row(doc))
+            self._db.execute("DELETE FROM stream_groups WHERE stream_id = ?", (entity_id,))
+            self._db.executemany("INSERT OR IGNORE INTO stream_groups (stream_id, group_id) VALUES (?, ?)",
+                                 [(entity_id, g) for g in _stream_groups(doc)])
+
+    def _remove(self, kind, entity_id):
+        self._db.execute("DELETE FROM entities WHERE kind = ? AND id = ?", (kind, entity_id))
+        if kind == 'streams':
+            self._db.execute("DELETE FROM streams WHERE id = ?", (entity_id,))
+            self._db.execute("DELETE FROM stream_groups WHERE stream_id = ?", (entity_id,))
+
+    def refresh(self, org_id, max_age=DEFAULT_MAX_AGE, max_workers=DEFAULT_MAX_WORKERS, kinds=KINDS):
+        """
+        Bring the catalog's copy of an organisation up to date.
+        :param org_id: str
+        :param max_age: entities checked less than this many seconds ago are trusted as they are. Use 0 to revalidate
+                        every entity, and None to only pick up new and removed entities.
+        :param max_workers: the maximum number of entities to fetch at the same time
+        :param kinds: the collections to refresh
+        :return: dict of counts of 'new', 'changed', 'unchanged', 'trusted' and 'removed' entities, and a dict of
+                 'errors' keyed by entity url
+        """
+        report = {'new': 0, 'changed': 0, 'unchanged': 0, 'trusted': 0, 'removed': 0, 'errors': {}}
+        now = time.time()
+        plans = [('organisations', {org_id: "{:s}/organisations/{:s}".format(get_endpoint(), org_id)})]
+        for kind in kinds:
+            plans.append((kind, self._index_urls(kind, org_id)))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for kind, urls in plans:
+                known = self._known(kind, org_id)
+                fetches = {}
+                for entity_id, url in urls.items():
+                    etag, checked, doc = known.get(entity_id, (None, None, None))
+                    if doc is not None and (max_age is None or now - checked < max_age):
+                        report['trusted'] += 1
+                        continue
+                    fetches[entity_id] = (url, doc, executor.submit(self._fetch, url, etag))
+                # Wait for the requests before taking the lock, so queries are not blocked on the network
+                results = {}
+                for entity_id, (url, old_doc, future) in fetches.items():
+                    try:
+                        results[entity_id] = (url, old_doc) + future.result()
+                    except Exception as e:
+                        report['errors'][url] = e
+                with self._lock, self._db:
+                    for entity_id in set(known) - set(urls):
+                        self._remove(kind, entity_id)
+                        report['removed'] += 1
+                    for entity_id, (url, old_doc, doc, etag) in results.items():
+                        if doc is None:
+                            # 304 Not Modified, just note that it was checked
+                            self._db.execute("UPDATE entities SET checked = ? WHERE kind = ? AND id = ?",
+                                             (now, kind, entity_id))
+                            report['unchanged'] += 1
+                            continue
+                        doc.pop('_links', None)
+                        if old_doc is None:
+                            report['new'] += 1
+                        elif json.loads(old_doc) == doc:
+                            report['unchanged'] += 1
+                        else:
+                            report['changed'] += 1
+                        self._store(kind, entity_id, url, etag, doc, now)
+        return report
+
+    def get(self, kind, entity_id):
+        """
+        :param kind: 'organisations', 'locations', 'groups' or 'streams'
+        :param entity_id: str
+        :return: the entity document
+        :raises KeyError: if the entity is not in the catalog
+        """
+        with self._lock:
+            row = self._db.execute("SELECT doc FROM entities WHERE kind = ? AND id = ?", (kind, entity_id)).fetchone()
+        if row is None:
+            raise KeyError(entity_id)
+        return json.loads(row[0])
+
+    def entities(self, kind, organisation_id=None):
+        """
+        :return: list of the entity documents of one kind, optionally only those in one organisation, sorted by id
+        """
+        sql = "SELECT doc FROM entities WHERE kind = ?"
+        args = [kind]
+        if organisation_id is not None:
+            sql += " AND organisation_id = ?"
+            args.append(organisation_id)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY id", args).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def _stream_query(self, select, filters):
+        unknown = set(filters) - set(STREAM_FILTERS)
+        if unknown:
+            raise ValueError("Unknown stream filters: {:s}, use any of {:s}".format(
+                ", ".join(sorted(unknown)), ", ".join(STREAM_FILTERS)))
+        sql = "SELECT {:s} FROM streams s".format(select)
+        where, args = [], []
+        for name, value in sorted(filters.items()):
+            if value is None:
+                continue
+            if name == 'group_id':
+                sql += " JOIN stream_groups g ON g.stream_id = s.id"
+                where.append("g.group_id = ?")
+            else:
+                where.append("s.{:s} = ?".format(name))
+            args.append(value)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            return self._db.execute(sql + " ORDER BY s.id", args).fetchall()
+
+    def stream_ids(self, **filters):
+        """
+        Find streams by their indexed attributes, from the local catalog only.
+        eg. `catalog.stream_ids(location_id="my.location", observed_property="http://.../soil_moisture")`
+        :param filters: any of organisation_id, location_id, observed_property, unit_of_measure, result_type, group_id
+        :return: sorted list of stream ids
+        """
+        return [r[0] for r in self._stream_query("s.id", filters)]
+
+    def streams(self, **filters):
+        """
+        Like `stream_ids()`, but returns the stream documents.
+        :return: list of stream documents, sorted by id
+        """
+        rows = self._stream_query("(SELECT doc FROM entities e WHERE e.kind = 'streams' AND e.id = s.id)", filters)
+        return [json.loads(r[0]) for r in rows]
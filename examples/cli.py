@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A command line tool which combines the example workflows, with an optional warm daemon for fast repeated use.
+
+    python3 examples/cli.py streams [--org ORG_ID]
+    python3 examples/cli.py groups [--org ORG_ID]
+    python3 examples/cli.py create-group GROUP_ID [--name NAME] [--description TEXT]
+    python3 examples/cli.py delete-group GROUP_ID [--cascade]
+    python3 examples/cli.py create-stream STREAM_ID --location LOCATION_ID --unit URI --property URI [--period PT1H]
+    python3 examples/cli.py delete-stream STREAM_ID [--cascade]
+    python3 examples/cli.py add STREAM_ID [CSV_FILE]   (reads "time,value" rows from stdin without a CSV_FILE)
+    python3 examples/cli.py get STREAM_ID [--start ISO8601] [--end ISO8601]   (writes "time,value" rows)
+    python3 examples/cli.py daemon [--idle-timeout SECONDS]
+    python3 examples/cli.py status | stop
+
+Each of the example scripts is a new process, which imports `pysc` and `haleasy`, sets up `pysc`, and checks that the
+organisation exists, before it makes the request it was run for. Cron jobs and ops tooling which run them many times a
+minute spend most of their time on that start up.
+
+This tool only imports the standard library until a command actually runs. When a daemon is running (started with
+`cli.py daemon`), each command is sent to it over a Unix socket, along with this process's stdin and stdout, and run
+there, on its already set up keep-alive session, with organisation, location, stream and group lookups answered from
+its metadata cache (see examples/metadata_cache.py). A command then costs the start up of a small Python process plus
+the API calls it makes. When no daemon is running, or it was started with other credentials, or with `--local`, the
+command runs in this process instead.
+
+The daemon holds the credentials of the user who started it, so only that user can use it. Its socket is made in a
+directory only they can open, the client checks that the process listening on it runs as the same user before sending
+anything, and the password itself is never sent, only a fingerprint of the settings.
+
+Run this file directly, rather than with `python3 -m examples.cli`, which imports the examples package, and `pysc`
+with it, first.
+The settings are read from the CONSTS below, which the SC_ENDPOINT, SC_USERNAME, SC_PASSWORD, SC_ORG_ID and
+PYSC_SOCKET environment variables, and then the command line options, override.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. This tool uses Unix sockets, so it
+runs on Linux and macOS, but not Windows.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import argparse
+import array
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+if not __package__:
+    # Run as a file, so make the examples package importable, for when a command runs in this process
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = False
+
+# Define some constants we will use for this tool
+CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+# The socket's directory is made by the daemon, and must only be accessible by the user who runs it
+CONSTS['SOCKET_PATH'] = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                                     "pysc-examples-{:d}".format(os.getuid()), "daemon.sock")
+# The number of seconds the daemon keeps metadata lookups for. Listings and lookups of entities changed by anyone
+# other than the daemon can be this far out of date.
+CONSTS['CACHE_TTL'] = 60.0
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+_MAX_REQUEST = 65536  # bytes, the largest command the daemon accepts
+
+
+def _link_id(link):
+    # The entity id is the last segment of the link's path
+    from urllib.parse import unquote
+    return unquote(link['href'].split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1])
+
+
+class CommandRunner(object):
+    """
+    Runs commands in this process. `pysc`, the shared session and the metadata cache are set up on the first command,
+    and then kept for every command after it, which is what keeps the daemon warm.
+    """
+
+    def __init__(self, settings, cache_ttl=None):
+        """
+        :param settings: dict of 'endpoint', 'username' and 'password'
+        :param cache_ttl: the number of seconds metadata lookups are cached for
+        """
+        self.settings = settings
+        self.cache_ttl = cache_ttl if cache_ttl is not None else CONSTS['CACHE_TTL']
+        self.cache = None
+        self.models = None
+        self._lock = threading.Lock()
+
+    def setup(self):
+        with self._lock:
+            if self.cache is not None:
+                return
+            import pysc.models
+            from examples.util import setup_sensorcloud_basic
+            from examples.metadata_cache import MetadataCache
+            setup_sensorcloud_basic(self.settings['username'], self.settings['password'], self.settings['endpoint'],
+                                    CONSTS['PYSC_DEBUG'], adaptive=True)
+            self.models = pysc.models
+            self.cache = MetadataCache(self.cache_ttl)
+
+    def single(self, model_name, entity_id):
+        """
+        :param model_name: the `pysc.models` class name, eg. 'Organisation'
+        :return: the cached model object
+        :raises RuntimeWarning: if the entity does not exist
+        """
+        try:
+            return self.cache.single(getattr(self.models, model_name), entity_id)
+        except KeyError:
+            raise RuntimeWarning("The {:s} named {:s} was not found.".format(model_name.lower(), entity_id))
+
+    def run(self, args, out, stdin):
+        """
+        Run one command.
+        :param args: the parsed command line, an argparse.Namespace
+        :param out: the text stream to write the output to
+        :param stdin: the text stream to read input from
+        :return: the exit status, 0 for success
+        """
+        self.setup()
+        return COMMANDS[args.command](self, args, out, stdin) or 0
+
+
+def _list_streams(runner, args, out, stdin):
+    from examples.crawl import iter_index_pages
+    runner.single('Organisation', args.org)
+    # Only the links on each index page are read, to print the ids there is no need to follow each link
+    for page in iter_index_pages(runner.models.Stream.index(params={'organisation_id': args.org})):
+        for link in page.links(rel="streams"):
+            out.write(_link_id(link) + "\n")
+
+
+def _list_groups(runner, args, out, stdin):
+    runner.single('Organisation', args.org)
+    groups = runner.cache.resolve_all(runner.models.Group, params={'organisation_id': args.org})
+    for group_id in sorted(g.id for g in groups):
+        out.write(group_id + "\n")
+
+
+def _create_group(runner, args, out, stdin):
+    runner.single('Organisation', args.org)
+    new_group = runner.models.Group(args.group_id)
+    new_group.name = args.name or args.group_id
+    new_group.description = args.description or new_group.name
+    new_group.organisation_id = args.org
+    # Saving an existing group overwrites it
+    group = runner.cache.save(new_group)
+    out.write(group.id + "\n")
+
+
+def _delete(runner, model_name, entity_id, cascade):
+    try:
+        runner.cache.delete(getattr(runner.models, model_name), entity_id, cascade)
+    except KeyError:
+        raise RuntimeWarning("The {:s} named {:s} was not found.".format(model_name.lower(), entity_id))
+
+
+def _delete_group(runner, args, out, stdin):
+    _delete(runner, 'Group', args.group_id, args.cascade)
+
+
+def _create_stream(runner, args, out, stdin):
+    runner.single('Organisation', args.org)
+    location = runner.single('Location', args.location)
+    Stream = runner.models.Stream
+    new_stream = Stream(args.stream_id)
+    new_stream.name = args.name or args.stream_id
+    new_stream.description = args.description or new_stream.name
+    new_stream.organisation_id = args.org
+    new_stream.location_id = location.id
+    new_stream.result_type = Stream.ResultTypes.scalar.value
+    new_stream.reporting_period = args.period
+    new_stream.sample_period = args.period
+    metadata = Stream.Metadata()
+    metadata.cumulative = args.cumulative
+    interpolation_types = Stream.Metadata.InterpolationTypes
+    if args.interpolation not in interpolation_types.__members__:
+        raise ValueError("Unknown interpolation type: {:s}, use one of {:s}".format(
+            args.interpolation, ", ".join(t.name for t in interpolation_types)))
+    metadata.interpolation_type = interpolation_types[args.interpolation].value
+    metadata.timezone = args.timezone
+    metadata.unit_of_measure = args.unit
+    metadata.observed_property = args.property
+    new_stream.stream_metadata = metadata
+    # Saving an existing stream overwrites it
+    stream = runner.cache.save(new_stream)
+    out.write(stream.id + "\n")
+
+
+def _delete_stream(runner, args, out, stdin):
+    _delete(runner, 'Stream', args.stream_id, args.cascade)
+
+
+def _add_observations(runner, args, out, stdin):
+    from examples.ingest import ingest, iter_csv_results, read_csv_results
+    stream = runner.single('Stream', args.stream_id)
+    if args.file in (None, '-'):
+        results = iter_csv_results(stdin, skip_header=args.header)
+    else:
+        results = read_csv_results(args.file, skip_header=args.header)
+    report = ingest(stream, results)
+    out.write(str(report) + "\n")
+    if report.failed_batches:
+        raise RuntimeError("{:d} batches failed to upload.".format(len(report.failed_batches)))
+
+
+def _get_observations(runner, args, out, stdin):
+    from examples.util import datetime_from_iso, datetime_to_iso
+    from examples.observations import iter_observations
+    stream = runner.single('Stream', args.stream_id)
+    start = datetime_from_iso(args.start) if args.start else None
+    end = datetime_from_iso(args.end) if args.end else None
+    for t, v in iter_observations(stream, start, end):
+        out.write("{:s},{:s}\n".format(datetime_to_iso(t), "" if v is None else str(v)))
+
+
+COMMANDS = {
+    'streams': _list_streams,
+    'groups': _list_groups,
+    'create-group': _create_group,
+    'delete-group': _delete_group,
+    'create-stream': _create_stream,
+    'delete-stream': _delete_stream,
+    'add': _add_observations,
+    'get': _get_observations,
+}
+
+
+def _run_command(runner, args, out, stdin):
+    """
+    :return: tuple of the exit status, and the error message or None
+    """
+    try:
+        status = runner.run(args, out, stdin)
+        out.flush()
+    except BrokenPipeError:
+        # The reader went away, eg. `cli.py get my.stream.1 | head`
+        return 0, None
+    except Exception as e:
+        logger.debug("The {:s} command failed.".format(args.command), exc_info=True)
+        return 1, str(e) or repr(e)
+    return status, None
+
+
+def _settings(args):
+    return {'endpoint': args.endpoint, 'username': args.username, 'password': args.password}
+
+
+def _fingerprint(settings):
+    # Lets the daemon check that a client has the same settings, without the client sending the password
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, runner):
+        socketserver.UnixStreamServer.__init__(self, path, _DaemonHandler)
+        self.runner = runner
+        self.fingerprint = _fingerprint(runner.settings)
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.failures = 0
+        self.active = 0
+        self.last_active = time.monotonic()
+
+    def status(self):
+        from examples.util import get_rate_controller
+        controller = get_rate_controller()
+        cache = self.runner.cache
+        with self.lock:
+            status = {'pid': os.getpid(), 'socket': self.server_address, 'endpoint': self.runner.settings['endpoint'],
+                      'uptime_s': round(time.time() - self.started, 1), 'commands': self.commands,
+                      'failures': self.failures, 'active': self.active}
+        status['cache'] = {'entries': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+        status['rate_control'] = controller.snapshot() if controller is not None else None
+        return status
+
+
+def _recv_request(sock):
+    # The command arrives as one line of JSON, the first part of it along with the client's stdin and stdout
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(_MAX_REQUEST, socket.CMSG_SPACE(2 * fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - (len(cdata) % fds.itemsize)])
+    while data and not data.endswith(b"\n") and len(data) < _MAX_REQUEST:
+        more = sock.recv(_MAX_REQUEST)
+        if not more:
+            break
+        data += more
+    return data, list(fds)
+
+
+class _DaemonHandler(socketserver.BaseRequestHandler):
+    """
+    Runs one command sent by a client, with the client's stdin and stdout, and replies with its exit status.
+    """
+
+    def handle(self):
+        server = self.server
+        if _peer_uid(self.request) not in (None, os.getuid()):
+            logger.warning("Refused a connection from another user.")
+            return
+        data, fds = _recv_request(self.request)
+        try:
+            reply = self._run(server, data, fds)
+        finally:
+            for fd in fds:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.request.sendall((json.dumps(reply) + "\n").encode('utf-8'))
+        if reply.get('stopping'):
+            threading.Thread(target=server.shutdown).start()
+
+    def _run(self, server, data, fds):
+        try:
+            args = argparse.Namespace(**json.loads(data.decode('utf-8')))
+        except (ValueError, TypeError):
+            # Not JSON, or not a JSON object
+            return {'status': 2, 'error': "Malformed command."}
+        command = getattr(args, 'command', None)
+        if not isinstance(command, str) or (command not in COMMANDS and command not in ('status', 'stop')):
+            return {'status': 2, 'error': "Malformed command."}
+        if command in COMMANDS and not isinstance(getattr(args, 'fingerprint', None), str):
+            return {'status': 2, 'error': "Malformed command."}
+        if args.command in COMMANDS and args.fingerprint != server.fingerprint:
+            # Started with other credentials, the client runs the command itself
+            return {'status': None, 'fallback': True}
+        if args.command == 'stop':
+            return {'status': 0, 'stopping': True}
+        if len(fds) != 2:
+            return {'status': 2, 'error': "The command must be sent with stdin and stdout."}
+        with server.lock:
+            server.active += 1
+        started = time.time()
+        stdin = open(fds.pop(0), 'r', encoding='utf-8', newline='')
+        out = open(fds.pop(0), 'w', encoding='utf-8')
+        try:
+            if args.command == 'status':
+                out.write(json.dumps(server.status(), indent=2, sort_keys=True) + "\n")
+                status, error = 0, None
+            else:
+                status, error = _run_command(server.runner, args, out, stdin)
+        finally:
+            for f in (stdin, out):
+                try:
+                    f.close()
+                except OSError:
+                    pass
+            with server.lock:
+                server.active -= 1
+                server.last_active = time.monotonic()
+        with server.lock:
+            server.commands += 1
+            server.failures += 1 if status else 0
+        logger.info("{:s} finished with status {:d} in {:.3f}s".format(args.command, status, time.time() - started))
+        return {'status': status, 'error': error}
+
+
+def _peer_uid(sock):
+    """
+    :return: the uid of the process at the other end of a connected Unix socket, or None where that is not available
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]  # pid, uid, gid
+
+
+def _connect(path):
+    """
+    :return: a socket connected to the daemon on path, or None if there is no daemon there which this user started
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        uid = _peer_uid(sock)
+        if uid is None:
+            # No peer credentials on this platform, the owner of the socket file is the next best thing
+            uid = os.stat(path).st_uid
+    except OSError:
+        sock.close()
+        return None
+    if uid != os.getuid():
+        sock.close()
+        logger.warning("Ignoring {:s}, it is served by another user.".format(path))
+        return None
+    return sock
+
+
+def _private_dir(path):
+    """
+    Make the directory of the socket at path, if needed, and check that only this user can open it.
+    :raises RuntimeError: if the directory is shared with other users
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError("The daemon's socket must be in a directory which only you can open, and {:s} is not. "
+                           "Use --socket or PYSC_SOCKET to choose another path.".format(directory))
+
+
+def _watch_idle(server, idle_timeout):
+    while True:
+        time.sleep(min(idle_timeout, 5.0))
+        with server.lock:
+            idle = server.active == 0 and time.monotonic() - server.last_active >= idle_timeout
+        if idle:
+            logger.info("Idle for {:.0f}s, stopping.".format(idle_timeout))
+            server.shutdown()
+            return
+
+
+def serve(args):
+    """
+    Run the daemon in this process, until it is stopped with `cli.py stop`, SIGTERM or SIGINT, or it has been idle
+    for args.idle_timeout seconds.
+    :return: the exit status
+    """
+    import signal
+    path = args.socket
+    try:
+        _private_dir(path)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    sock = _connect(path)
+    if sock is not None:
+        sock.close()
+        print("A daemon is already running on {:s}".format(path), file=sys.stderr)
+        return 1
+    if os.path.exists(path):
+        # Left behind by a daemon which did not stop cleanly
+        os.unlink(path)
+
+    runner = CommandRunner(_settings(args), args.cache_ttl)
+    runner.setup()
+    try:
+        # Warm up the connection, and the lookup every command starts with
+        runner.single('Organisation', args.org)
+    except Exception as e:
+        logger.warning("Could not look up the organisation {:s}: {:s}".format(args.org, str(e) or repr(e)))
+
+    # Only the user who started the daemon can connect to it, the daemon holds their credentials
+    old_umask = os.umask(0o177)
+    try:
+        server = _DaemonServer(path, runner)
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.idle_timeout:
+        threading.Thread(target=_watch_idle, args=(server, args.idle_timeout), daemon=True).start()
+    logger.info("Serving commands on {:s}".format(path))
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+
+def _send_to_daemon(args):
+    """
+    Send the command to the daemon, if there is one, to run there.
+    :return: the exit status of the command, or None if there is no daemon which can run it
+    """
+    try:
+        fds = array.array('i', [sys.stdin.fileno(), sys.stdout.fileno()])
+    except (AttributeError, OSError, ValueError):
+        # stdin or stdout is not a real file, eg. when captured
+        return None
+    sock = _connect(args.socket)
+    if sock is None:
+        return None
+    request = dict(vars(args))
+    # The daemon only needs to know whether it has the same settings, so the password stays in this process
+    request['fingerprint'] = _fingerprint(_settings(args))
+    del request['password']
+    if request.get('file') not in (None, '-'):
+        request['file'] = os.path.abspath(request['file'])
+    sys.stdout.flush()
+    with sock:
+        sock.sendmsg([(json.dumps(request) + "\n").encode('utf-8')],
+                     [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+        reply = sock.makefile('rb').readline()
+    if not reply:
+        print("error: The daemon stopped before the command finished.", file=sys.stderr)
+        return 1
+    reply = json.loads(reply.decode('utf-8'))
+    if reply.get('fallback'):
+        return None
+    if reply.get('error'):
+        print("error: {:s}".format(reply['error']), file=sys.stderr)
+    return reply['status']
+
+
+def build_parser():
+    """
+    :return: the argparse.ArgumentParser of this tool, with defaults from CONSTS and the environment
+    """
+    env = os.environ
+    parser = argparse.ArgumentParser(description="Run SensorCloud example workflows, optionally through a warm daemon.")
+    parser.add_argument('--endpoint', default=env.get('SC_ENDPOINT', CONSTS['SC_ENDPOINT']))
+    parser.add_argument('--username', default=env.get('SC_USERNAME', CONSTS['SC_USERNAME']))
+    parser.add_argument('--password', default=env.get('SC_PASSWORD', CONSTS['SC_PASSWORD']),
+                        help="prefer the SC_PASSWORD environment variable, command lines are visible to other users")
+    parser.add_argument('--org', default=env.get('SC_ORG_ID', CONSTS['ORG_ID']), help="the organisation id")
+    parser.add_argument('--socket', default=env.get('PYSC_SOCKET', CONSTS['SOCKET_PATH']),
+                        help="the Unix socket of the daemon")
+    parser.add_argument('--local', action='store_true', help="run the command in this process, even with a daemon")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    commands.add_parser('streams', help="list the ids of the organisation's streams")
+    commands.add_parser('groups', help="list the ids of the organisation's groups")
+
+    p = commands.add_parser('create-group', help="create or overwrite a group")
+    p.add_argument('group_id')
+    p.add_argument('--name', help="defaults to the group id")
+    p.add_argument('--description', help="defaults to the name")
+
+    p = commands.add_parser('delete-group', help="delete a group")
+    p.add_argument('group_id')
+    p.add_argument('--cascade', action='store_true')
+
+    p = commands.add_parser('create-stream', help="create or overwrite a scalar stream at an existing location")
+    p.add_argument('stream_id')
+    p.add_argument('--location', required=True, help="the location id")
+    p.add_argument('--unit', required=True, help="the unit of measure URI")
+    p.add_argument('--property', required=True, help="the observed property URI")
+    p.add_argument('--name', help="defaults to the stream id")
+    p.add_argument('--description', help="defaults to the name")
+    p.add_argument('--period', default="PT1H", help="the reporting and sample period, an ISO8601 duration")
+    p.add_argument('--interpolation', default="discontinuous",
+                   help="an interpolation type name from pysc's Stream.Metadata.InterpolationTypes")
+    p.add_argument('--timezone', help="required for cumulative streams, eg. Australia/Brisbane")
+    p.add_argument('--cumulative', action='store_true')
+
+    p = commands.add_parser('delete-stream', help="delete a stream")
+    p.add_argument('stream_id')
+    p.add_argument('--cascade', action='store_true')
+
+    p = commands.add_parser('add', help="upload \"time,value\" CSV rows to a stream")
+    p.add_argument('stream_id')
+    p.add_argument('file', nargs='?', help="the CSV file, or - (the default) for stdin")
+    p.add_argument('--no-header', dest='header', action='store_false', help="the first row is data, not a header")
+
+    p = commands.add_parser('get', help="write a stream's observations as \"time,value\" CSV rows")
+    p.add_argument('stream_id')
+    p.add_argument('--start', help="ISO8601 time, defaults to the start of the stream")
+    p.add_argument('--end', help="ISO8601 time (inclusive), defaults to the end of the stream")
+
+    p = commands.add_parser('daemon', help="serve commands on the socket, keeping the session and metadata warm")
+    p.add_argument('--idle-timeout', type=float, default=0.0, help="stop after this many idle seconds, 0 for never")
+    p.add_argument('--cache-ttl', type=float, default=CONSTS['CACHE_TTL'],
+                   help="the number of seconds metadata lookups are kept for")
+
+    commands.add_parser('status', help="show the daemon's uptime, counters and cache statistics")
+    commands.add_parser('stop', help="stop the daemon")
+    return parser
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return: the exit status
+    """
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command == 'daemon':
+        logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+        # The tracebacks of failed commands are only logged in debug mode
+        logger.setLevel(logging.DEBUG if CONSTS['PYSC_DEBUG'] else logging.INFO)
+        return serve(args)
+    if not args.local:
+        status = _send_to_daemon(args)
+        if status is not None:
+            return status
+    if args.command in ('status', 'stop'):
+        print("No daemon is running on {:s}".format(args.socket), file=sys.stderr)
+        return 1
+    status, error = _run_command(CommandRunner(_settings(args)), args, sys.stdout, sys.stdin)
+    if error:
+        print("error: {:s}".format(error), file=sys.stderr)
+    return status
+
+# script execution entrypoint
+if __name__ == "__main__":
+    sys.exit(main())
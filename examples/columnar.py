@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar decoding of observation results into NumPy arrays.
+
+Each observation result from SensorCloud is a dict like `{'t': '2017-01-01T00:00:00.000000Z', 'v': {'v': 1.0}}`.
+Turning every result into a Python `datetime` and unwrapping the nested value one at a time is slow and memory hungry
+for large reads, so these helpers decode a whole page of results into a `datetime64[us]` array of times and a
+`float64` array of values, which can be appended to a growable `ColumnBuffer`.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import numpy as np
+from examples.util import datetimes_from_iso, get_instrumentation
+
+TIME_DTYPE = np.dtype('datetime64[us]')
+VALUE_DTYPE = np.dtype('float64')
+
+
+def unwrap_value(v):
+    """
+    Scalar streams can return the value either directly, or wrapped in a dict like {'v': 1.0}.
+    :return: the bare value
+    """
+    if isinstance(v, dict):
+        return v.get('v')
+    return v
+
+
+def decode_times(timestamps):
+    """
+    Decode a sequence of SensorCloud ISO8601 UTC timestamp strings into a `datetime64[us]` array.
+    :param timestamps: sequence of timestamp strings, eg. '2017-01-01T00:00:00.000000Z'
+    :return: numpy array with dtype datetime64[us]
+    """
+    return datetimes_from_iso(timestamps, as_numpy=True)
+
+
+def decode_results(results):
+    """
+    Decode a list of observation results into columnar time and value arrays.
+    Handles both scalar values, and values nested in a dict. Missing values become NaN.
+    :param results: list of result dicts, eg. `Observation.results`
+    :return: tuple of (datetime64[us] array, float64 array)
+    """
+    instrumentation = get_instrumentation()
+    if instrumentation is not None:
+        with instrumentation.timer('columnar'):
+            return _decode_results(results)
+    return _decode_results(results)
+
+
+def _decode_results(results):
+    times = decode_times([r['t'] for r in results])
+    values = np.array([unwrap_value(r['v']) for r in results], dtype=VALUE_DTYPE)
+    return times, values
+
+
+def page_to_arrays(page):
+    """
+    Decode a page from `examples.observations.iter_observation_pages()` into columnar time and value arrays.
+    :param page: list of (datetime, result) tuples
+    :return: tuple of (datetime64[us] array, float64 array)
+    """
+    return decode_results([r for _, r in page])
+
+
+class ColumnBuffer(object):
+    """
+    A growable pair of time and value columns.
+    Capacity is doubled as needed, so appending many pages is amortised O(n) without holding a Python object per row.
+    """
+    __slots__ = ('_times', '_values', '_size')
+
+    def __init__(self, capacity=1024):
+        capacity = max(int(capacity), 1)
+        self._times = np.empty(capacity, dtype=TIME_DTYPE)
+        self._values = np.empty(capacity, dtype=VALUE_DTYPE)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._times)
+
+    @property
+    def times(self):
+        """
+        :return: a view of the filled part of the time column
+        """
+        return self._times[:self._size]
+
+    @property
+    def values(self):
+        """
+        :return: a view of the filled part of the value column
+        """
+        return self._values[:self._size]
+
+    def _reserve(self, needed):
+        capacity = self.capacity
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        times = np.empty(capacity, dtype=TIME_DTYPE)
+        values = np.empty(capacity, dtype=VALUE_DTYPE)
+        times[:self._size] = self._times[:self._size]
+        values[:self._size] = self._values[:self._size]
+        self._times = times
+        self._values = values
+
+    def append(self, times, values):
+        """
+        Append equal length time and value arrays to the end of the buffer.
+        :param times: array-like of datetime64[us]
+        :param values: array-like of float64
+        :return: the number of rows appended
+        """
+        n = len(times)
+        if n != len(values):
+            raise ValueError("times and values must be the same length.")
+        end = self._size + n
+        self._reserve(end)
+        self._times[self._size:end] = times
+        self._values[self._size:end] = values
+        self._size = end
+        return n
+
+    def append_row(self, time, value):
+        """
+        Append a single row to the end of the buffer.
+        :param time: datetime or datetime64
+        :param value: float
+        """
+        end = self._size + 1
+        self._reserve(end)
+        self._times[self._size] = time
+        self._values[self._size] = value
+        self._size = end
+
+    def append_results(self, results):
+        """
+        Decode a page of observation results and append them to the buffer.
+        :param results: list of result dicts, eg. `Observation.results`
+        :return: the number of rows appended
+        """
+        times, values = decode_results(results)
+        return self.append(times, values)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for crawling paginated HAL index documents returned by `pysc`, such as the one returned from
+`pysc.models.Stream.index()`.
+
+Following each link on an index page one at a time means one blocking round trip per entity. The helpers here follow
+the links on a page in parallel with a bounded number of worker threads, and fetch the `rel="next"` page in the
+background while the current page is still being resolved. Results are always yielded in index order.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+from concurrent.futures import ThreadPoolExecutor
+from haleasy import LinkNotFoundError
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def _follow_next(index):
+    """
+    Follow the `rel="next"` link on a HAL index page.
+    :param index: a HAL index document
+    :return: the next HAL index document, or None if this is the last page
+    """
+    try:
+        next_link = index.link(rel="next")
+    except LinkNotFoundError:
+        return None
+    return next_link.follow()
+
+
+def iter_index_pages(index, prefetch=True):
+    """
+    Generator over the pages of a paginated HAL index, starting with the given page.
+    When `prefetch` is True, the next page is requested in the background as soon as the current page is yielded.
+    :param index: the first HAL index document, eg. the return value of `pysc.models.Stream.index()`
+    :param prefetch: fetch page N+1 while the caller is working on page N
+    :return: generator of HAL index documents
+    """
+    if not prefetch:
+        while index is not None:
+            yield index
+            index = _follow_next(index)
+        return
+    with ThreadPoolExecutor(max_workers=1) as page_executor:
+        while index is not None:
+            next_page = page_executor.submit(_follow_next, index)
+            try:
+                yield index
+            except GeneratorExit:
+                next_page.cancel()
+                raise
+            index = next_page.result()
+
+
+def iter_resolved_links(index, rel, max_workers=DEFAULT_MAX_WORKERS, prefetch=True):
+    """
+    Generator which follows every link with the given rel on every page of a paginated HAL index.
+    The links on each page are followed concurrently, using at most `max_workers` simultaneous requests, while the
+    next page of the index is prefetched. The resolved HAL objects are yielded in the same order as they appear in the
+    index, so this is a drop-in replacement for calling `.follow()` on each link in turn.
+    :param index: the first HAL index document, eg. the return value of `pysc.models.Stream.index()`
+    :param rel: the link relation to follow on each page, eg. "streams"
+    :param max_workers: the maximum number of links to follow at once
+    :param prefetch: fetch the next index page while the current page is being resolved
+    :return: generator of (HALLink, HAL object) tuples
+    """
+    if max_workers is None or max_workers < 1:
+        raise ValueError("max_workers must be a positive integer.")
+    with ThreadPoolExecutor(max_workers=max_workers) as link_executor:
+        for page in iter_index_pages(index, prefetch=prefetch):
+            links = page.links(rel=rel)
+            futures = [link_executor.submit(l.follow) for l in links]
+            try:
+                for l, f in zip(links, futures):
+                    yield l, f.result()
+            except BaseException:
+                # Don't leave the rest of this page's requests queued if the caller stops early or a follow fails.
+                for f in futures:
+                    f.cancel()
+                raise
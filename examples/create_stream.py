@@ -14,6 +14,7 @@ import logging
 import sys
 import pysc.models
 from examples.util import setup_sensorcloud_basic
+from examples.metadata_cache import MetadataCache
 
 MODULE = sys.modules[__name__]
 CONSTS = MODULE.CONSTS = dict()
@@ -42,13 +43,16 @@ def main():
     # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
     setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
                             CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'])
+    # Lookups of organisations and locations are cached, long running jobs should share one cache between all their
+    # lookups
+    metadata_cache = MetadataCache()
 
     org_id = CONSTS['ORG_ID']
     location_id = CONSTS['LOCATION_ID']
     stream_id = CONSTS['NEW_STREAM_ID']
     # Ensure the organisation exists on the SensorCloud endpoint.
     try:
-        organisation = pysc.models.Organisation.single(org_id)
+        organisation = metadata_cache.single(pysc.models.Organisation, org_id)
     except KeyError:
         raise RuntimeWarning("""The organisation named {:s} was not found.\n""".format(org_id))
     # Ensure sanity, check we got the organisation that we asked for.
@@ -56,14 +60,14 @@ def main():
 
     # First we must ensure we have our location in the SensorCloud. If not, we will create it.
     try:
-        location = pysc.models.Location.single(location_id)
+        location = metadata_cache.single(pysc.models.Location, location_id)
     except KeyError:
         # it doesn't exist, so we will create it. We know the details
         new_location = pysc.models.Location(location_id)
         new_location.organisation_id = org_id
         new_location.geo_json = pysc.models.Location.GeoJSON(lat=-27.494743, lon=153.030034)
         new_location.description = "ESP Site in Brisbane"
-        location = new_location.save()  # Upload it to SensorCloud, and then use it for our stream.
+        location = metadata_cache.save(new_location)  # Upload it to SensorCloud, and then use it for our stream.
 
     new_stream = pysc.models.Stream(stream_id)  # The equiv of calling `models.Stream(None, 'stream_id', None)`
     # This creates a new stream in memory on the client side, but it is not pushed to SensorCloud yet.
@@ -90,7 +94,8 @@ def main():
     metadata.observed_property = "http://data.sense-t.org.au/registry/def/sop/soil_moisture"
 
     new_stream.stream_metadata = metadata
-    stream = new_stream.save()  # This sends (saves) the new stream to SensorCloud, and receives a Stream object
+    # This sends (saves) the new stream to SensorCloud, and receives a Stream object
+    stream = metadata_cache.save(new_stream)
 
     # Important!
     # If there was already a stream with the same id on SensorCloud, the existing one will be overwritten!
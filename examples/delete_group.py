@@ -14,6 +14,7 @@ import logging
 import sys
 import pysc.models
 from examples.util import setup_sensorcloud_basic
+from examples.metadata_cache import MetadataCache
 
 MODULE = sys.modules[__name__]
 CONSTS = MODULE.CONSTS = dict()
@@ -41,12 +42,15 @@ def main():
     # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
     setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
                             CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'])
+    # Lookups of organisations and groups are cached, long running jobs should share one cache between all their
+    # lookups
+    metadata_cache = MetadataCache()
 
     org_id = CONSTS['ORG_ID']
     group_id = CONSTS['GROUP_ID']
     # Ensure the organisation exists on the SensorCloud endpoint.
     try:
-        organisation = pysc.models.Organisation.single(org_id)
+        organisation = metadata_cache.single(pysc.models.Organisation, org_id)
     except KeyError:
         raise RuntimeWarning("""The organisation named {:s} was not found.""".format(org_id))
     # Ensure sanity, check we got the organisation that we asked for.
@@ -54,7 +58,7 @@ def main():
 
     # Ensure the group exists on the SensorCloud endpoint.
     try:
-        group = pysc.models.Group.single(group_id)
+        group = metadata_cache.single(pysc.models.Group, group_id)
     except KeyError:
         raise RuntimeWarning("""The group named {:s} was not found.""".format(group_id))
     # Ensure sanity, check we got the group that we asked for.
@@ -62,12 +66,14 @@ def main():
 
     # NOTE! We cannot delete a group that is assigned to any users or groups or anything.
     try:
-        pysc.models.Group.delete(group_id, False)  # the second argument is `cascade`, we don't want to do that here.
+        # the second argument is `cascade`, we don't want to do that here.
+        # Deleting through the cache also forgets the cached group, so the check below really goes to SensorCloud.
+        metadata_cache.delete(pysc.models.Group, group_id, False)
     except KeyError:
         raise RuntimeError("The group {:s} was not found on the SensorCloud endpoint!".format(group_id))
     group = None
     try:
-        group = pysc.models.Group.single(group_id)
+        group = metadata_cache.single(pysc.models.Group, group_id)
     except KeyError:
         # We intend to hit this exception
         print("""The group named {:s} was deleted!.""".format(group_id))
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk export of observation results from many streams to local columnar files, and a memory-mapped reader for them.
+
+An export is a directory holding one data file per stream and a small `index.json`. The data file of a stream is named
+after its id, with a short hash of the id so that ids which only differ in unsafe characters (eg. `a/b` and `a_b`) get
+different files. Each data file is a sequence of chunks of up to `chunk_rows` results, and each chunk holds the time
+column (int64 microseconds since the unix epoch) and the value column (float64). The index records the time range, row
+count and byte offsets of every chunk, so a range query only touches the chunks which overlap it.
+
+With `compress=True` (the default) each column of a chunk is delta encoded (times only), byte shuffled and zlib
+compressed, which makes regularly sampled streams very small. With `compress=False` the columns are stored raw, and
+the reader returns NumPy views straight into the memory-mapped file, without copying or decoding anything.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pysc.models
+from examples.columnar import TIME_DTYPE, page_to_arrays
+from examples.observations import iter_observation_pages, DEFAULT_CHUNK_SIZE
+
+FORMAT_VERSION = 1
+INDEX_FILENAME = "index.json"
+DEFAULT_CHUNK_ROWS = 65536
+DEFAULT_COMPRESS_LEVEL = 6
+_TIME_DISK_DTYPE = np.dtype('<i8')  # microseconds since the unix epoch
+_VALUE_DISK_DTYPE = np.dtype('<f8')
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+# Each export worker has up to two requests open, for the page it is reading and the next page, prefetched
+REQUESTS_PER_WORKER = 2
+
+logger = logging.getLogger(__name__)
+
+
+def _data_filename(stream_id):
+    digest = hashlib.sha1(stream_id.encode('utf-8')).hexdigest()[:10]
+    return "{:s}-{:s}.col".format(_UNSAFE_FILENAME_CHARS.sub('_', stream_id), digest)
+
+
+def _shuffle(a):
+    # Group the n-th byte of every element together, so the slowly changing high bytes compress well
+    return a.view(np.uint8).reshape(-1, a.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(buf, dtype, rows):
+    return np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, rows).T.copy().view(dtype).reshape(rows)
+
+
+class _StreamWriter(object):
+    """
+    Writes the chunks of one stream's data file, and builds its index entry.
+    """
+
+    def __init__(self, path, chunk_rows, compress, level):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.level = level
+        self._file = open(path + ".tmp", 'wb')
+        self._pending_times = []
+        self._pending_values = []
+        self._pending = 0
+        self.chunks = []
+        self.rows = 0
+
+    def add(self, times, values):
+        self._pending_times.append(np.asarray(times, dtype=TIME_DTYPE).view(_TIME_DISK_DTYPE))
+        self._pending_values.append(np.asarray(values, dtype=_VALUE_DISK_DTYPE))
+        self._pending += len(times)
+        if self._pending >= self.chunk_rows:
+            self._drain(final=False)
+
+    def _drain(self, final):
+        if not self._pending:
+            return
+        times = np.concatenate(self._pending_times)
+        values = np.concatenate(self._pending_values)
+        start = 0
+        while len(times) - start >= self.chunk_rows or (final and start < len(times)):
+            end = start + self.chunk_rows
+            self._write_chunk(times[start:end], values[start:end])
+            start = end
+        self._pending_times = [times[start:]]
+        self._pending_values = [values[start:]]
+        self._pending = len(times) - start
+
+    def _write_column(self, data):
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data)]
+
+    def _write_chunk(self, times, values):
+        if self.compress:
+            deltas = np.empty_like(times)
+            deltas[0] = times[0]
+            deltas[1:] = np.diff(times)
+            t = self._write_column(zlib.compress(_shuffle(deltas), self.level))
+            v = self._write_column(zlib.compress(_shuffle(values), self.level))
+        else:
+            t = self._write_column(times.tobytes())
+            v = self._write_column(values.tobytes())
+        self.chunks.append({'first': int(times[0]), 'last': int(times[-1]), 'rows': len(times), 't': t, 'v': v})
+        self.rows += len(times)
+
+    def close(self):
+        """
+        Write the last partial chunk, and move the finished data file into place.
+        :return: the index entry for the stream
+        """
+        self._drain(final=True)
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        return {'file': os.path.basename(self.path), 'rows': self.rows, 'compressed': self.compress,
+                'chunks': self.chunks}
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + ".tmp")
+
+
+def export_stream(stream, directory, start=None, end=None, chunk_rows=DEFAULT_CHUNK_ROWS, compress=True,
+                  level=DEFAULT_COMPRESS_LEVEL, page_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export the observation results of one stream to a columnar data file. The results are read and written a page at
+    a time, so memory use is bounded by the chunk size, not the length of the stream.
+    :param stream: a `pysc.models.Stream`
+    :param directory: the export directory
+    :param start: datetime, export results at or after this time, defaults to the start of the stream
+    :param end: datetime, export results up to this time (inclusive), defaults to the end of the stream
+    :param chunk_rows: the number of results per chunk
+    :param compress: compress each chunk, see the module docs
+    :param level: the zlib compression level
+    :param page_size: the number of results to request per page, or an AdaptivePageSize
+    :return: the index entry for the stream
+    """
+    writer = _StreamWriter(os.path.join(directory, _data_filename(stream.id)), chunk_rows, compress, level)
+    try:
+        for page in iter_observation_pages(stream, start, end, page_size):
+            writer.add(*page_to_arrays(page))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def _read_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': FORMAT_VERSION, 'streams': {}}
+
+
+def _write_index(directory, index):
+    path = os.path.join(directory, INDEX_FILENAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def export_streams(stream_ids, directory, max_workers=4, start=None, end=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                   compress=True, level=DEFAULT_COMPRESS_LEVEL, page_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Export many streams concurrently, one stream per worker, and update the export's index.
+    Streams already in the index are replaced, other streams in the index are kept.
+    See `export_stream()` for the other parameters.
+    :param stream_ids: iterable of stream ids, eg. from the get_streams.py crawl
+    :param directory: the export directory, it is created if it does not exist
+    :param max_workers: the maximum number of streams to export at the same time. Size the connection pool to
+                        max_workers * REQUESTS_PER_WORKER, so connections are reused.
+    :param progress: optional callable, called as `progress(stream_id, rows, error)` as each stream finishes, with
+                     the number of results exported, or the exception which stopped it
+    :return: dict of stream id -> error, for the streams which could not be exported
+    """
+    os.makedirs(directory, exist_ok=True)
+    index = _read_index(directory)
+    lock = threading.Lock()
+    errors = {}
+
+    def _export(stream_id):
+        stream = pysc.models.Stream.single(stream_id)
+        entry = export_stream(stream, directory, start, end, chunk_rows, compress, level, page_size)
+        with lock:
+            index['streams'][stream_id] = entry
+        return entry['rows']
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_export, i): i for i in stream_ids}
+        for f in as_completed(futures):
+            stream_id = futures[f]
+            try:
+                rows, error = f.result(), None
+            except Exception as e:
+                logger.error("Exporting stream {:s} failed: {:s}".format(stream_id, repr(e)))
+                rows, error = 0, e
+                errors[stream_id] = e
+            if progress is not None:
+                progress(stream_id, rows, error)
+    _write_index(directory, index)
+    return errors
+
+
+class ExportReader(object):
+    """
+    Reads streams back from an export directory, with memory-mapped data files.
+    Can be used as a context manager, to unmap the files when done. Arrays returned by `read()` from an uncompressed
+    export are views into the mapped files, a file which still has views on it is unmapped once they are all gone.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._streams = _read_index(directory)['streams']
+        self._maps = {}  # stream id -> mmap
+        self._bounds = {}  # stream id -> (first times, last times) of the chunks
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            for m in self._maps.values():
+                try:
+                    m.close()
+                except BufferError:
+                    pass  # numpy views of the map are still in use, it is unmapped when they are collected
+            self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def stream_ids(self):
+        return sorted(self._streams)
+
+    def __len__(self):
+        return len(self._streams)
+
+    def rows(self, stream_id):
+        return self._streams[stream_id]['rows']
+
+    def _map(self, stream_id):
+        with self._lock:
+            m = self._maps.get(stream_id)
+            if m is None:
+                entry = self._streams[stream_id]
+                with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                    m = self._maps[stream_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                chunks = entry['chunks']
+                self._bounds[stream_id] = (np.array([c['first'] for c in chunks], dtype=np.int64),
+                                           np.array([c['last'] for c in chunks], dtype=np.int64))
+            return m
+
+    def _chunk(self, m, chunk, compressed):
+        rows = chunk['rows']
+        (t_offset, t_length), (v_offset, v_length) = chunk['t'], chunk['v']
+        if not compressed:
+            times = np.frombuffer(m, dtype=_TIME_DISK_DTYPE, count=rows, offset=t_offset)
+            values = np.frombuffer(m, dtype=_VALUE_DISK_DTYPE, count=rows, offset=v_offset)
+            return times, values
+        view = memoryview(m)
+        try:
+            times = np.cumsum(_unshuffle(zlib.decompress(view[t_offset:t_offset + t_length]), _TIME_DISK_DTYPE, rows))
+            values = _unshuffle(zlib.decompress(view[v_offset:v_offset + v_length]), _VALUE_DISK_DTYPE, rows)
+        finally:
+            view.release()
+        return times, values
+
+    def read(self, stream_id, start=None, end=None):
+        """
+        Read the results of a stream in a time range, only touching the chunks which overlap the range.
+        :param stream_id: str
+        :param start: datetime, read results at or after this time
+        :param end: datetime, read results up to this time (inclusive)
+        :return: tuple of (datetime64[us] array, float64 array)
+        :raises KeyError: if the stream is not in the export
+        """
+        entry = self._streams[stream_id]
+        if not entry['rows']:
+            return np.empty(0, dtype=TIME_DTYPE), np.empty(0, dtype=_VALUE_DISK_DTYPE)
+        m = self._map(stream_id)
+        firsts, lasts = self._bounds[stream_id]
+        low = np.datetime64(start, 'us').astype(np.int64) if start is not None else None
+        high = np.datetime64(end, 'us').astype(np.int64) if end is not None else None
+        first_chunk = int(np.searchsorted(lasts, low, side='left')) if low is not None else 0
+        last_chunk = int(np.searchsorted(firsts, high, side='right')) if high is not None else len(firsts)
+        times_parts, values_parts = [], []
+        for chunk in entry['chunks'][first_chunk:last_chunk]:
+            times, values = self._chunk(m, chunk, entry['compressed'])
+            i = int(np.searchsorted(times, low, side='left')) if low is not None else 0
+            j = int(np.searchsorted(times, high, side='right')) if high is not None else len(times)
+            times_parts.append(times[i:j])
+            values_parts.append(values[i:j])
+        if not times_parts:
+            return np.empty(0, dtype=TIME_DTYPE), np.empty(0, dtype=_VALUE_DISK_DTYPE)
+        if len(times_parts) == 1:
+            times, values = times_parts[0], values_parts[0]
+        else:
+            times, values = np.concatenate(times_parts), np.concatenate(values_parts)
+        return times.view(TIME_DTYPE), values
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of using `pysc` to login to a SensorCloud instance endpoint and export the observations of every stream
+belonging to a given organisation to local columnar files, which can then be reloaded without going back to
+SensorCloud. See examples/export.py for the file format.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. Preferably use python 3.5 for best
+compatibility and performance. 3.6 _should_ work, but it is not tested.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import logging
+import sys
+import pysc.models
+from examples.util import setup_sensorcloud_basic
+from examples.crawl import iter_resolved_links, DEFAULT_MAX_WORKERS
+from examples.export import export_streams, ExportReader, REQUESTS_PER_WORKER
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+CONSTS['EXPORT_DIR'] = "export"  # The directory to write the columnar files to
+CONSTS['MAX_WORKERS'] = 4  # The maximum number of streams to export at the same time
+CONSTS['COMPRESS'] = True  # Set to False for larger files which can be read back without any decoding
+
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    # The connection pool is sized for the busier of the two steps, the stream crawl (its link workers plus the
+    # prefetched index page) or the export (each worker's page request plus its prefetched next page).
+    pool_size = max(DEFAULT_MAX_WORKERS + 1, CONSTS['MAX_WORKERS'] * REQUESTS_PER_WORKER)
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'], pool_size=pool_size)
+
+    org_id = CONSTS['ORG_ID']
+    # Ensure the organisation exists on the SensorCloud endpoint.
+    try:
+        organisation = pysc.models.Organisation.single(org_id)
+    except KeyError:
+        raise RuntimeWarning("""The organisation named {:s} was not found.\n""".format(org_id))
+    # Ensure sanity, check we got the organisation that we asked for.
+    assert (org_id == organisation.id)
+
+    # Find every stream in the organisation, the same way as the get_streams.py example
+    stream_index = pysc.models.Stream.index(params={'organisation_id': org_id})
+    stream_ids = [stream['id'] for s, stream in iter_resolved_links(stream_index, "streams")]
+    print("Exporting {:d} streams to {:s}".format(len(stream_ids), CONSTS['EXPORT_DIR']))
+
+    errors = export_streams(stream_ids, CONSTS['EXPORT_DIR'], max_workers=CONSTS['MAX_WORKERS'],
+                            compress=CONSTS['COMPRESS'])
+    for stream_id, error in sorted(errors.items()):
+        print("FAILED to export stream {:s}: {:s}".format(stream_id, str(error)))
+
+    # Read the export back, this only maps the files, and decodes just the chunks that are asked for.
+    with ExportReader(CONSTS['EXPORT_DIR']) as reader:
+        for stream_id in stream_ids:
+            if stream_id in errors:
+                continue
+            times, values = reader.read(stream_id)
+            print("Exported stream {:s}: {:d} observation results.".format(stream_id, len(times)))
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
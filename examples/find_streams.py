@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of using `pysc` to login to a SensorCloud instance endpoint, keep a local catalog of the streams, locations
+and groups of an organisation, and find streams by their attributes without crawling every stream each time.
+
+The first run fetches every entity. Later runs only fetch new entities, and revalidate the ones which have not been
+checked for a while. See examples/catalog.py.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. Preferably use python 3.5 for best
+compatibility and performance. 3.6 _should_ work, but it is not tested.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import logging
+import sys
+import time
+from examples.util import setup_sensorcloud_basic
+from examples.catalog import StreamCatalog
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+CONSTS['CATALOG_PATH'] = "catalog.sqlite"  # The local catalog database, it is created if it does not exist
+CONSTS['MAX_AGE'] = 3600  # Revalidate catalog entries which have not been checked for this many seconds
+CONSTS['MAX_WORKERS'] = 8  # The maximum number of entities to fetch at the same time
+# The attributes of the streams to find. Leave any of them out, or set it to None, to match everything.
+CONSTS['FILTERS'] = {
+    'location_id': "brisbane.esp.site.1",
+    'observed_property': "http://data.sense-t.org.au/registry/def/sop/soil_moisture",
+}
+
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    # The connection pool is sized to match the number of workers.
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'], pool_size=CONSTS['MAX_WORKERS'])
+
+    org_id = CONSTS['ORG_ID']
+    with StreamCatalog(CONSTS['CATALOG_PATH']) as catalog:
+        report = catalog.refresh(org_id, max_age=CONSTS['MAX_AGE'], max_workers=CONSTS['MAX_WORKERS'])
+        print("Refreshed the catalog for {:s}: {:d} new, {:d} changed, {:d} unchanged, {:d} trusted, {:d} removed."
+              .format(org_id, report['new'], report['changed'], report['unchanged'], report['trusted'],
+                      report['removed']))
+        for url, error in sorted(report['errors'].items()):
+            print("FAILED to refresh {:s}: {:s}".format(url, str(error)))
+        try:
+            catalog.get('organisations', org_id)
+        except KeyError:
+            raise RuntimeWarning("""The organisation named {:s} was not found.\n""".format(org_id))
+
+        started = time.time()
+        stream_ids = catalog.stream_ids(organisation_id=org_id, **CONSTS['FILTERS'])
+        elapsed = time.time() - started
+        for stream_id in stream_ids:
+            print("Found stream: {:s}".format(stream_id))
+        print("Found {:d} matching streams in {:.1f}ms.".format(len(stream_ids), elapsed * 1000.0))
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,13 @@ __copyright__ = "Copyright 2017, CSIRO Land and Water"
 import logging
 import sys
 import pysc.models
-from datetime import datetime, timedelta
+from datetime import datetime
 from examples.util import setup_sensorcloud_basic, datetime_from_iso
+from examples.observations import fetch_partitioned, iter_observations, iter_observation_pages
+from examples.columnar import ColumnBuffer, page_to_arrays, unwrap_value
+from examples.obs_cache import ObservationCache
+from examples.aggregate import iter_aggregates
+from examples.json_stream import iter_page_columns
 
 MODULE = sys.modules[__name__]
 CONSTS = MODULE.CONSTS = dict()
@@ -27,6 +32,23 @@ CONSTS['PYSC_DEBUG'] = True
 
 # Define some constants we will use for this example
 CONSTS['STREAM_ID'] = "my.stream.1"  # The stream from which we want to get observations
+# The time range to read, in every mode below. END of None means "up until now".
+CONSTS['START'] = datetime(2010, 1, 1)
+CONSTS['END'] = None
+# Set PARALLEL_WORKERS above 1 to split the START to END time range into windows and read them concurrently.
+# This is much faster for streams with many years of observations.
+CONSTS['PARALLEL_WORKERS'] = 0
+# Set COLUMNAR to True to decode the results into numpy time and value arrays, rather than printing each result.
+CONSTS['COLUMNAR'] = False
+# Set STREAMED_PAGE_SIZE to read pages of that many results, each decoded into numpy arrays as the response arrives, so
+# even very large pages are never held as JSON text or as a list of dicts.
+CONSTS['STREAMED_PAGE_SIZE'] = 0
+# Set CACHE_PATH to a filename to keep a local SQLite copy of the stream. Each run then only downloads observations
+# newer than the last run, and the results are read back from the local copy.
+CONSTS['CACHE_PATH'] = None
+# Set AGGREGATE to an ISO8601 duration, eg. "PT1H" or "P1D", to print the count, min, max and mean of each interval
+# rather than each result. Set it to "" to use the stream's own reporting_period.
+CONSTS['AGGREGATE'] = None
 
 # Set up logging for this example file
 logger = logging.getLogger(__name__)
@@ -51,28 +73,54 @@ def main():
     # Ensure sanity, check we got the stream that we asked for.
     assert (stream_id == stream.id)
 
-    # get observations in chunks of 1000 results at a time
-    chunk_size = 1000
-    offset = datetime.min
-
-    while True:
-        obs = stream.filtered_observations(limit=chunk_size, start=offset)
-        c = len(obs.results)
-        if c < 1:
-            break
-        results = obs.results
-        last_time = offset
+    if CONSTS['CACHE_PATH']:
+        with ObservationCache(CONSTS['CACHE_PATH']) as cache:
+            received = cache.sync(stream)
+            print("Synced {:d} new observation results into the local cache.".format(received))
+            for time, val in cache.read(stream_id, CONSTS['START'], CONSTS['END']):
+                print("Found observation result: {:s}: {:f}".format(str(time), val))
+        return
+
+    workers = CONSTS['PARALLEL_WORKERS']
+    if workers and workers > 1:
+        end = CONSTS['END'] or datetime.utcnow()
+        # Read disjoint time windows of the stream at the same time, then merge them back into time order.
+        results = fetch_partitioned(stream, CONSTS['START'], end, workers=workers)
         for r in results:
-            time = r['t']
-            time = datetime_from_iso(time)
-            if time > last_time:
-                last_time = time
-            val = r['v']
-            if isinstance(val, dict):
-                val = val['v']
+            time = datetime_from_iso(r['t'])
+            val = unwrap_value(r['v'])
             print("Found observation result: {:s}: {:f}".format(str(time), val))
-        # add one second to the offset to avoid overlap with the final result in the last set
-        offset = last_time + timedelta(seconds=1)
+        return
+
+    if CONSTS['AGGREGATE'] is not None:
+        # Reduce each page into interval buckets as it arrives, the raw results are never all held in memory.
+        for rows in iter_aggregates(stream, CONSTS['AGGREGATE'] or None, CONSTS['START'], CONSTS['END']):
+            for row in rows:
+                print("Found aggregate: {:s}: count={:d} min={:f} max={:f} mean={:f}".format(
+                    str(row['start'].item()), int(row['count']), row['min'], row['max'], row['mean']))
+        return
+
+    if CONSTS['STREAMED_PAGE_SIZE']:
+        buffer = ColumnBuffer()
+        for times, values in iter_page_columns(stream_id, CONSTS['START'], CONSTS['END'],
+                                               limit=CONSTS['STREAMED_PAGE_SIZE']):
+            buffer.append(times, values)
+        print("Read {:d} observation results into columnar arrays.".format(len(buffer)))
+        return
+
+    if CONSTS['COLUMNAR']:
+        # Decode each page straight into numpy time and value columns, without a dict and a datetime per result.
+        buffer = ColumnBuffer()
+        for page in iter_observation_pages(stream, CONSTS['START'], CONSTS['END'], chunk_size=1000):
+            buffer.append(*page_to_arrays(page))
+        print("Read {:d} observation results into columnar arrays.".format(len(buffer)))
+        return
+
+    # get observations in chunks of 1000 results at a time.
+    # `iter_observations` does the pagination for us, and downloads the next chunk in the background while we are
+    # still printing the current one.
+    for time, val in iter_observations(stream, CONSTS['START'], CONSTS['END'], chunk_size=1000):
+        print("Found observation result: {:s}: {:f}".format(str(time), val))
 
 # script execution entrypoint
 if __name__ == "__main__":
@@ -13,8 +13,8 @@ __copyright__ = "Copyright 2017, CSIRO Land and Water"
 import logging
 import sys
 import pysc.models
-from haleasy import LinkNotFoundError
 from examples.util import setup_sensorcloud_basic
+from examples.crawl import iter_resolved_links
 
 MODULE = sys.modules[__name__]
 CONSTS = MODULE.CONSTS = dict()
@@ -27,6 +27,7 @@ CONSTS['PYSC_DEBUG'] = True
 
 # Define some constants we will use for this example
 CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+CONSTS['MAX_WORKERS'] = 8  # The maximum number of stream links to follow at the same time.
 
 # Set up logging for this example file
 logger = logging.getLogger(__name__)
@@ -58,22 +59,16 @@ def main():
     # use the organisation_id param to filter streams based on id
     stream_index = pysc.models.Stream.index(params={'organisation_id': org_id})
     stream_count = 0
-    while True:
-        stream_links = stream_index.links(rel="streams")
-        # using the `.links()` helper on the index, we get a list of HALLink objects, not stream objects.
-        # we have to do `.follow()` on each one to turn it into a HAL object.
-        # Note, even after we do .follow() on the link, it is still not a `pysc` Stream() object, but a raw HAL object.
-        # See the get_groups.py example for an example of using `.resolve_all()` rather than `.index()`
-        for s in stream_links:
-            stream_count += 1
-            stream = s.follow()
-            stream_id = stream['id']  # We have to use ['id'] because it is a raw HAL object, not a Stream() object.
-            print("Found stream: {:s}".format(stream_id))
-        try:
-            next_index = stream_index.link(rel="next")
-            stream_index = next_index.follow()
-        except LinkNotFoundError:
-            break
+    # using the `.links()` helper on the index, we get a list of HALLink objects, not stream objects.
+    # we have to do `.follow()` on each one to turn it into a HAL object.
+    # Note, even after we do .follow() on the link, it is still not a `pysc` Stream() object, but a raw HAL object.
+    # See the get_groups.py example for an example of using `.resolve_all()` rather than `.index()`
+    # The `iter_resolved_links` helper does the `.follow()` calls for each page of the index in parallel, and fetches
+    # the rel="next" page of the index in the background. The streams still come back in index order.
+    for s, stream in iter_resolved_links(stream_index, "streams", max_workers=CONSTS['MAX_WORKERS']):
+        stream_count += 1
+        stream_id = stream['id']  # We have to use ['id'] because it is a raw HAL object, not a Stream() object.
+        print("Found stream: {:s}".format(stream_id))
     print("Found a total of {:d} streams for {:s} on that SensorCloud endpoint.".format(stream_count, org_id))
 
 # script execution entrypoint
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of using `pysc` to login to a SensorCloud instance endpoint and harvest the observations of every stream
+belonging to a given organisation, using all of the CPU cores of the machine.
+
+Reading a stream is mostly JSON decoding and timestamp parsing, which keeps one core busy per process. Here the
+organisation's streams are listed once, with the same crawl as the get_streams.py example, then split into shards, and
+each shard is harvested by its own process. Every process sets up its own `pysc` settings and HTTP session with
+`setup_sensorcloud_basic()`, and writes its own columnar export (see examples/export.py) to `<HARVEST_DIR>/shard-<n>`,
+so the processes never share a file. Progress and failures from all of the processes are reported here, in one place.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. Preferably use python 3.5 for best
+compatibility and performance. 3.6 _should_ work, but it is not tested.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pysc.models
+from examples.util import setup_sensorcloud_basic
+from examples.crawl import iter_resolved_links
+from examples.export import export_streams, REQUESTS_PER_WORKER
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+CONSTS['HARVEST_DIR'] = "harvest"  # Each process writes its own export into a subdirectory of this
+CONSTS['PROCESSES'] = None  # The number of worker processes, None means one per CPU core
+CONSTS['THREADS_PER_PROCESS'] = 2  # Streams read at the same time in each process, to overlap network waits
+
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def shard(stream_ids, shards):
+    """
+    Split the stream ids into shards, dealing them out in turn so each shard gets a similar number of streams.
+    :param stream_ids: list of str
+    :param shards: the number of shards
+    :return: list of lists of stream ids, empty shards are left out
+    """
+    return [s for s in (stream_ids[i::shards] for i in range(shards)) if s]
+
+
+def _harvest_shard(shard_no, stream_ids, directory, settings, threads, events):
+    # Runs in a worker process. Nothing is inherited from the parent's `pysc` setup, the process sets up its own.
+    setup_sensorcloud_basic(settings['username'], settings['password'], settings['endpoint'], settings['debug'],
+                            pool_size=threads * REQUESTS_PER_WORKER)
+
+    def _progress(stream_id, rows, error):
+        # Exceptions are sent as text, not every exception can be pickled back to the parent
+        events.put((shard_no, stream_id, rows, None if error is None else repr(error)))
+
+    errors = export_streams(stream_ids, directory, max_workers=threads, progress=_progress)
+    return {k: repr(v) for k, v in errors.items()}
+
+
+def harvest(stream_ids, directory, settings, processes=None, threads_per_process=2, progress=None):
+    """
+    Harvest the observations of many streams, sharded across a pool of processes.
+    :param stream_ids: list of str
+    :param directory: the harvest directory, each shard is written to the `shard-<n>` subdirectory of it
+    :param settings: dict with the 'username', 'password', 'endpoint' and 'debug' settings each process sets up with
+    :param processes: the number of worker processes, defaults to the number of CPU cores
+    :param threads_per_process: the number of streams each process reads at the same time
+    :param progress: optional callable, called in this process as `progress(shard_no, stream_id, rows, error)` as each
+                     stream finishes, error is None or the text of the exception
+    :return: dict of stream id -> error text, for every stream which could not be harvested
+    """
+    processes = processes or os.cpu_count() or 1
+    shards = shard(list(stream_ids), processes)
+    errors = {}
+    finished = set()
+
+    def _report(event):
+        shard_no, stream_id, rows, error = event
+        finished.add(stream_id)
+        if error is not None:
+            errors[stream_id] = error
+        if progress is not None:
+            progress(shard_no, stream_id, rows, error)
+
+    with multiprocessing.Manager() as manager:
+        events = manager.Queue()
+        with ProcessPoolExecutor(max_workers=len(shards) or 1) as executor:
+            futures = [executor.submit(_harvest_shard, n, ids, os.path.join(directory, "shard-{:d}".format(n)),
+                                       settings, threads_per_process, events) for n, ids in enumerate(shards)]
+            while not all(f.done() for f in futures):
+                try:
+                    _report(events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+        while True:
+            try:
+                _report(events.get_nowait())
+            except queue.Empty:
+                break
+    for n, f in enumerate(futures):
+        try:
+            f.result()
+        except Exception as e:
+            # The whole process failed, eg. it could not log in. Fail every stream in the shard it didn't report on.
+            logger.error("Harvest shard {:d} failed: {:s}".format(n, repr(e)))
+            for stream_id in shards[n]:
+                if stream_id not in finished:
+                    errors[stream_id] = repr(e)
+    return errors
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'])
+
+    org_id = CONSTS['ORG_ID']
+    # Ensure the organisation exists on the SensorCloud endpoint.
+    try:
+        organisation = pysc.models.Organisation.single(org_id)
+    except KeyError:
+        raise RuntimeWarning("""The organisation named {:s} was not found.\n""".format(org_id))
+    # Ensure sanity, check we got the organisation that we asked for.
+    assert (org_id == organisation.id)
+
+    # List the streams once, here, with the same crawl as the get_streams.py example
+    stream_index = pysc.models.Stream.index(params={'organisation_id': org_id})
+    stream_ids = [stream['id'] for s, stream in iter_resolved_links(stream_index, "streams")]
+    total = len(stream_ids)
+    print("Harvesting {:d} streams for {:s}".format(total, org_id))
+
+    settings = {'username': CONSTS['SC_USERNAME'], 'password': CONSTS['SC_PASSWORD'],
+                'endpoint': CONSTS['SC_ENDPOINT'], 'debug': CONSTS['PYSC_DEBUG']}
+    started = time.time()
+    done = [0]
+
+    def _progress(shard_no, stream_id, rows, error):
+        done[0] += 1
+        if error is None:
+            print("[{:d}/{:d}] shard {:d}: harvested {:d} results from {:s}".format(
+                done[0], total, shard_no, rows, stream_id))
+        else:
+            print("[{:d}/{:d}] shard {:d}: FAILED to harvest {:s}: {:s}".format(
+                done[0], total, shard_no, stream_id, error))
+
+    errors = harvest(stream_ids, CONSTS['HARVEST_DIR'], settings, CONSTS['PROCESSES'],
+                     CONSTS['THREADS_PER_PROCESS'], progress=_progress)
+    print("Harvested {:d} of {:d} streams in {:.1f}s, {:d} failed.".format(
+        total - len(errors), total, time.time() - started, len(errors)))
+    for stream_id, error in sorted(errors.items()):
+        print("FAILED: {:s}: {:s}".format(stream_id, error))
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
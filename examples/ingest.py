@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+A streaming bulk ingestion pipeline for uploading large numbers of observation results to a stream.
+
+The add_observations.py example builds one list of results in memory, and uploads it with a single
+`Observation.save()`. That does not scale to uploading millions of results from a CSV file or a logger dump, so
+these helpers read results lazily from any iterable, cut them into batches bounded by both result count and
+approximate payload size, and upload the batches with a small number of requests in flight at once.
+Failed batches are retried on their own, batches which were already saved are never sent again.
+Only a bounded number of batches are held in memory at any time, no matter how large the input is.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import csv
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from examples.util import datetime_to_iso, datetime_from_iso, get_instrumentation, get_rate_controller
+from examples.columnar import unwrap_value
+import pysc.models
+
+DEFAULT_BATCH_COUNT = 5000
+DEFAULT_BATCH_BYTES = 1024 * 1024  # approximate JSON payload size of one batch
+DEFAULT_IN_FLIGHT = 3
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0  # seconds, doubled after each failed attempt of a batch
+# An approximation of the JSON overhead of one result, eg. {"t": "", "v": {"v": }},
+_RESULT_OVERHEAD = 24
+
+logger = logging.getLogger(__name__)
+
+
+def make_result(timestamp, value):
+    """
+    Build one observation result in the shape SensorCloud expects.
+    :param timestamp: datetime, or an already formatted timestamp string
+    :param value: float
+    :return: dict
+    """
+    if not isinstance(timestamp, str):
+        timestamp = datetime_to_iso(timestamp)
+    return {"t": timestamp, "v": {"v": value}}
+
+
+def read_csv_results(filename, time_column=0, value_column=1, skip_header=True):
+    """
+    Generator which lazily reads observation results from a CSV file, one row at a time.
+    :param filename: path to the CSV file
+    :param time_column: the index of the column holding the ISO8601 timestamp
+    :param value_column: the index of the column holding the value
+    :param skip_header: skip the first row of the file
+    :return: generator of result dicts
+    """
+    with open(filename, newline='') as f:
+        for result in iter_csv_results(f, time_column, value_column, skip_header):
+            yield result
+
+
+def iter_csv_results(lines, time_column=0, value_column=1, skip_header=True):
+    """
+    Like `read_csv_results()`, but reads the rows from an open file or any other iterable of lines, eg. sys.stdin.
+    :return: generator of result dicts
+    """
+    reader = csv.reader(lines)
+    if skip_header:
+        next(reader, None)
+    for row in reader:
+        if not row:
+            continue
+        # Round trip the timestamp, so any variant in the file is normalised to the SensorCloud layout
+        yield make_result(datetime_from_iso(row[time_column].strip()), float(row[value_column]))
+
+
+def iter_batches(results, max_count=DEFAULT_BATCH_COUNT, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Cut a (possibly very long) iterable of results into lists bounded by both result count and approximate size.
+    :param results: iterable of result dicts
+    :param max_count: the maximum number of results in one batch
+    :param max_bytes: the approximate maximum JSON size of one batch
+    :return: generator of lists of result dicts
+    """
+    batch = []
+    size = 0
+    for r in results:
+        r_size = len(r['t']) + len(repr(unwrap_value(r['v']))) + _RESULT_OVERHEAD
+        if batch and (len(batch) >= max_count or size + r_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(r)
+        size += r_size
+    if batch:
+        yield batch
+
+
+class IngestReport(object):
+    """
+    Running totals for an ingestion run.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.batches = 0
+        self.results = 0
+        self.retries = 0
+        self.failed_batches = []  # list of (batch_number, exception) tuples
+        self._lock = threading.Lock()
+
+    def add_retry(self):
+        # Retries are counted from the upload threads
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def results_per_second(self):
+        elapsed = self.elapsed
+        return self.results / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return ("Uploaded {:d} results in {:d} batches in {:.2f}s ({:.0f} results/s), "
+                "{:d} retries, {:d} failed batches.".format(self.results, self.batches, self.elapsed,
+                                                            self.results_per_second, self.retries,
+                                                            len(self.failed_batches)))
+
+
+def save_batch(stream, batch, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, report=None):
+    """
+    Upload one batch of results to a stream with a single `Observation.save()`, retrying with exponential backoff.
+    :param stream: a `pysc.models.Stream`
+    :param batch: list of result dicts
+    :param retries: the number of times to retry if the upload fails
+    :param backoff: the delay in seconds before the first retry, doubled for each subsequent retry
+    :param report: optional IngestReport, to count the retries in
+    :return: the number of results uploaded
+    """
+    controller = get_rate_controller()
+    attempt = 0
+    while True:
+        try:
+            obs = pysc.models.Observation(None, stream=stream)  # The None just means we are creating a new observation
+            obs.results = batch
+            if controller is None:
+                obs.save()
+            else:
+                # The retries here are enough, the rate controller must not retry each attempt as well
+                with controller.no_retries():
+                    obs.save()
+            return len(batch)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            if report is not None:
+                report.add_retry()
+            instrumentation = get_instrumentation()
+            if instrumentation is not None:
+                instrumentation.record_retry('save')
+            delay = backoff * (2 ** attempt)
+            logger.warning("Uploading a batch of {:d} results failed ({:s}), retrying in {:.1f}s."
+                           .format(len(batch), repr(e), delay))
+            time.sleep(delay)
+            attempt += 1
+
+
+def ingest(stream, results, max_count=DEFAULT_BATCH_COUNT, max_bytes=DEFAULT_BATCH_BYTES,
+           in_flight=DEFAULT_IN_FLIGHT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, progress=None):
+    """
+    Upload an iterable of results to a stream, in bounded batches, with several batch uploads in flight at once.
+    The input is consumed lazily, so at most `in_flight` batches are held in memory at any time.
+    A batch which fails is retried on its own, up to `retries` times. A batch which still fails is recorded in the
+    report and the rest of the upload carries on.
+    :param stream: a `pysc.models.Stream`
+    :param results: iterable of result dicts, eg. from `read_csv_results()`
+    :param max_count: the maximum number of results in one batch
+    :param max_bytes: the approximate maximum JSON size of one batch
+    :param in_flight: the maximum number of batch uploads running at once
+    :param retries: the number of times to retry a failed batch
+    :param backoff: the delay in seconds before the first retry of a batch, doubled for each subsequent retry
+    :param progress: optional callable, given the IngestReport after each batch completes
+    :return: IngestReport
+    """
+    if in_flight < 1:
+        raise ValueError("in_flight must be a positive integer.")
+    report = IngestReport()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=in_flight) as executor:
+        def _collect(done):
+            for f in done:
+                number = pending.pop(f)
+                try:
+                    report.results += f.result()
+                    report.batches += 1
+                except Exception as e:
+                    logger.error("Batch {:d} failed after {:d} retries: {:s}".format(number, retries, repr(e)))
+                    report.failed_batches.append((number, e))
+                if progress is not None:
+                    progress(report)
+
+        for number, batch in enumerate(iter_batches(results, max_count, max_bytes)):
+            if len(pending) >= in_flight:
+                # Wait for a slot before reading any more of the input, this keeps memory use flat.
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            pending[executor.submit(save_batch, stream, batch, retries, backoff, report)] = number
+        done, _ = wait(pending)
+        _collect(done)
+    report.finished = time.time()
+    return report
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of a long-running asyncio service which buffers incoming readings for many streams, and uploads them to
+SensorCloud in batches.
+
+Field gateways push small numbers of readings for hundreds of streams at once. Doing one `Observation.save()` per
+reading (as in the add_observations.py example) means one request per tiny write. Instead, the
+`BufferedIngestService` here keeps a buffer per stream, and flushes a stream's buffer as one `Observation` upload
+when it reaches a size threshold, or when its oldest reading reaches a time deadline.
+When too many readings are buffered or in flight, `put()` waits for space, applying backpressure to the producers.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. This example uses async/await,
+so it requires python 3.5 or above.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import asyncio
+import logging
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pysc.models
+from examples.util import setup_sensorcloud_basic
+from examples.ingest import make_result, save_batch, DEFAULT_RETRIES, DEFAULT_BACKOFF
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['STREAM_IDS'] = ["my.stream.1", "my.stream.2"]  # These streams must already exist, see create_stream.py
+CONSTS['READINGS_PER_STREAM'] = 250  # The number of simulated readings to push to each stream
+CONSTS['FLUSH_COUNT'] = 100  # Flush a stream once it has buffered this many readings
+CONSTS['FLUSH_DELAY'] = 5.0  # Flush a stream once its oldest buffered reading is this many seconds old
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+DEFAULT_FLUSH_COUNT = 1000
+DEFAULT_FLUSH_DELAY = 10.0
+DEFAULT_MAX_BUFFERED = 100000
+DEFAULT_CONCURRENT_FLUSHES = 4
+
+
+class BufferedIngestService(object):
+    """
+    Buffers readings per stream, and flushes each stream's buffer as one `Observation` upload when it reaches
+    `flush_count` readings, or when its oldest reading has waited `flush_delay` seconds.
+    Use `await service.start()` before putting readings, and `await service.stop()` to flush everything that is left.
+    """
+
+    def __init__(self, flush_count=DEFAULT_FLUSH_COUNT, flush_delay=DEFAULT_FLUSH_DELAY,
+                 max_buffered=DEFAULT_MAX_BUFFERED, concurrent_flushes=DEFAULT_CONCURRENT_FLUSHES,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, stream_factory=None):
+        """
+        :param flush_count: flush a stream once it has buffered this many readings
+        :param flush_delay: flush a stream once its oldest buffered reading is this many seconds old
+        :param max_buffered: the maximum number of readings buffered or being uploaded, across all streams,
+                             before `put()` waits for space
+        :param concurrent_flushes: the maximum number of uploads running at once
+        :param retries: the number of times to retry a failed upload
+        :param backoff: the delay in seconds before the first retry of an upload
+        :param stream_factory: callable which takes a stream id and returns a `pysc.models.Stream` to upload to,
+                               defaults to creating a client side `pysc.models.Stream(stream_id)` with no round trip
+        """
+        if flush_count < 1 or max_buffered < flush_count:
+            raise ValueError("flush_count must be positive, and no more than max_buffered.")
+        self.flush_count = flush_count
+        self.flush_delay = flush_delay
+        self.max_buffered = max_buffered
+        self.retries = retries
+        self.backoff = backoff
+        self.stream_factory = stream_factory or pysc.models.Stream
+        self._executor = ThreadPoolExecutor(max_workers=concurrent_flushes)
+        self._buffers = {}  # stream_id -> list of result dicts
+        self._deadlines = {}  # stream_id -> loop time at which the buffer must be flushed
+        self._streams = {}  # stream_id -> pysc Stream
+        self._buffered = 0  # readings currently buffered, or being uploaded
+        self._space = None
+        self._flushes = set()
+        self._ticker = None
+        # Running totals
+        self.uploads = 0
+        self.uploaded = 0
+        self.failed = 0
+
+    async def start(self):
+        """
+        Start the background task which flushes buffers when their deadline passes.
+        """
+        self._space = asyncio.Condition()
+        self._ticker = asyncio.ensure_future(self._tick())
+
+    async def stop(self):
+        """
+        Flush every buffer, wait for all uploads to finish, and stop the service.
+        """
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        for stream_id in list(self._buffers):
+            self._flush(stream_id)
+        while self._flushes:
+            await asyncio.gather(*list(self._flushes))
+        self._executor.shutdown()
+
+    async def put(self, stream_id, timestamp, value):
+        """
+        Buffer one reading for a stream. Waits if the service is already holding `max_buffered` readings.
+        :param stream_id: str
+        :param timestamp: datetime
+        :param value: float
+        """
+        async with self._space:
+            await self._space.wait_for(lambda: self._buffered < self.max_buffered)
+            self._buffered += 1
+        buffer = self._buffers.get(stream_id)
+        if buffer is None:
+            buffer = self._buffers[stream_id] = []
+            self._deadlines[stream_id] = asyncio.get_event_loop().time() + self.flush_delay
+        buffer.append(make_result(timestamp, value))
+        if len(buffer) >= self.flush_count:
+            self._flush(stream_id)
+
+    def _flush(self, stream_id):
+        # Hand the buffer over to an upload task, new readings for this stream go into a fresh buffer
+        batch = self._buffers.pop(stream_id)
+        self._deadlines.pop(stream_id, None)
+        task = asyncio.ensure_future(self._upload(stream_id, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _upload(self, stream_id, batch):
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            stream = self._streams[stream_id] = self.stream_factory(stream_id)
+        loop = asyncio.get_event_loop()
+        try:
+            # pysc is blocking, so the upload runs on a worker thread
+            await loop.run_in_executor(self._executor, save_batch, stream, batch, self.retries, self.backoff)
+            self.uploads += 1
+            self.uploaded += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("Uploading {:d} readings to stream {:s} failed: {:s}".format(len(batch), stream_id, repr(e)))
+        finally:
+            async with self._space:
+                self._buffered -= len(batch)
+                self._space.notify_all()
+
+    async def _tick(self):
+        loop = asyncio.get_event_loop()
+        interval = max(self.flush_delay / 4.0, 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            now = loop.time()
+            for stream_id, deadline in list(self._deadlines.items()):
+                if deadline <= now:
+                    self._flush(stream_id)
+
+
+async def simulate_gateway(service, stream_ids, readings_per_stream):
+    """
+    Push simulated readings for many streams into the service, the way a field gateway would.
+    """
+    for _ in range(readings_per_stream):
+        for stream_id in stream_ids:
+            await service.put(stream_id, datetime.utcnow(), random.random() * 10.0)
+        await asyncio.sleep(0.001)
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'])
+
+    async def run():
+        service = BufferedIngestService(flush_count=CONSTS['FLUSH_COUNT'], flush_delay=CONSTS['FLUSH_DELAY'])
+        await service.start()
+        try:
+            await simulate_gateway(service, CONSTS['STREAM_IDS'], CONSTS['READINGS_PER_STREAM'])
+        finally:
+            await service.stop()
+        print("Uploaded {:d} readings in {:d} uploads, {:d} readings failed."
+              .format(service.uploaded, service.uploads, service.failed))
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run())
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
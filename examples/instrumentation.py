@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Request-level instrumentation of the `pysc` API calls made by the examples.
+
+When enabled (pass `instrument=True` to `setup_sensorcloud_basic()` or `setup_sensorcloud_apikey()` in
+examples.util), this records for every API operation (`single`, `index`, `follow`, `resolve_all`, `save`, `delete`,
+`filtered_observations`) and every HTTP request made on its behalf: the number of calls, wall time, bytes received,
+response status codes, errors and retries, plus the client side time spent decoding responses.
+The counters and latency histograms can be read in-process with `snapshot()`, or written out with `dump_json()`.
+
+When it is not enabled, none of the hooks are installed, so there is no overhead at all.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import contextlib
+import functools
+import inspect
+import json
+import threading
+import time
+import haleasy
+import pysc.models
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last bucket catches everything slower.
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+# The `pysc` model methods which are timed as API operations
+MODEL_OPERATIONS = ('single', 'index', 'resolve_all', 'save', 'delete', 'filtered_observations')
+MODEL_NAMES = ('Organisation', 'Location', 'Group', 'Stream', 'Observation')
+
+
+class Histogram(object):
+    """
+    A fixed-bucket latency histogram, with count, total, min and max.
+    """
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * len(HISTOGRAM_BOUNDS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        ms = seconds * 1000.0
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        :param p: the percentile, between 0 and 100
+        :return: the upper bound in seconds of the bucket holding the percentile, or None if empty
+        """
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, n in zip(HISTOGRAM_BOUNDS_MS, self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(bound / 1000.0, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_s': self.total / self.count if self.count else None,
+            'min_s': self.min,
+            'max_s': self.max,
+            'p50_s': self.percentile(50),
+            'p99_s': self.percentile(99),
+            'buckets_ms': {('inf' if b == float('inf') else str(b)): n
+                           for b, n in zip(HISTOGRAM_BOUNDS_MS, self.buckets)},
+        }
+
+
+class _Stats(object):
+    __slots__ = ('latency', 'errors', 'retries', 'bytes', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.statuses = {}
+
+    def as_dict(self):
+        d = self.latency.as_dict()
+        d.update({'errors': self.errors, 'retries': self.retries, 'bytes': self.bytes,
+                  'statuses': {str(k): v for k, v in sorted(self.statuses.items())}})
+        return d
+
+
+class Instrumentation(object):
+    """
+    Thread-safe counters and latency histograms for API operations, HTTP requests and decoding.
+    HTTP requests are attributed to the innermost API operation running on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}  # operation name -> _Stats
+            self.http = {}  # operation name -> _Stats, for the HTTP requests made by that operation
+            self.decode = {}  # decoder name -> Histogram
+            self.started = time.time()
+
+    def current_operation(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else 'other'
+
+    @contextlib.contextmanager
+    def operation(self, name):
+        """
+        Time an API operation, and attribute any HTTP requests made inside it to that operation.
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                stats = self.operations.get(name)
+                if stats is None:
+                    stats = self.operations[name] = _Stats()
+                stats.latency.add(elapsed)
+                if failed:
+                    stats.errors += 1
+
+    def record_http(self, elapsed, status=None, size=0, error=False):
+        """
+        Record one HTTP request, against the current operation.
+        """
+        name = self.current_operation()
+        with self._lock:
+            stats = self.http.get(name)
+            if stats is None:
+                stats = self.http[name] = _Stats()
+            stats.latency.add(elapsed)
+            stats.bytes += size
+            if status is not None:
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if error or (status is not None and status >= 400):
+                stats.errors += 1
+
+    def record_retry(self, name=None):
+        """
+        Count a retry of an operation, eg. a batch upload being sent again.
+        """
+        name = name or self.current_operation()
+        with self._lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = _Stats()
+            stats.retries += 1
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Time a block of client side decoding work.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                hist = self.decode.get(name)
+                if hist is None:
+                    hist = self.decode[name] = Histogram()
+                hist.add(elapsed)
+
+    def snapshot(self):
+        """
+        :return: a JSON serialisable dict of every counter and histogram
+        """
+        with self._lock:
+            return {
+                'elapsed_s': time.time() - self.started,
+                'operations': {k: v.as_dict() for k, v in sorted(self.operations.items())},
+                'http': {k: v.as_dict() for k, v in sorted(self.http.items())},
+                'decode': {k: v.as_dict() for k, v in sorted(self.decode.items())},
+            }
+
+    def dump_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+# The patches currently installed, as (owner, attribute name, original value in the owner's __dict__ or None)
+_PATCHES = []
+
+
+def _wrap_callable(func, instrumentation, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with instrumentation.operation(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _wrap_decoder(func, instrumentation, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with instrumentation.timer(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _patch(owner, attr, wrap):
+    raw = inspect.getattr_static(owner, attr, None)
+    if raw is None:
+        return
+    if isinstance(raw, classmethod):
+        patched = classmethod(wrap(raw.__func__))
+    elif isinstance(raw, staticmethod):
+        patched = staticmethod(wrap(raw.__func__))
+    elif callable(raw):
+        patched = wrap(raw)
+    else:
+        return
+    _PATCHES.append((owner, attr, owner.__dict__.get(attr)))
+    setattr(owner, attr, patched)
+
+
+def install(instrumentation):
+    """
+    Install the hooks which time the `pysc` model operations, `haleasy` link following and HAL decoding.
+    HTTP requests are recorded by the shared session, see examples.util.PooledSession.
+    """
+    uninstall()
+    for model_name in MODEL_NAMES:
+        model = getattr(pysc.models, model_name, None)
+        if model is None:
+            continue
+        for op in MODEL_OPERATIONS:
+            _patch(model, op, lambda f, op=op: _wrap_callable(f, instrumentation, op))
+    _patch(haleasy.HALEasyLink, 'follow', lambda f: _wrap_callable(f, instrumentation, 'follow'))
+    _patch(haleasy.HALEasy, 'from_json', lambda f: _wrap_decoder(f, instrumentation, 'hal_json'))
+
+
+def uninstall():
+    """
+    Remove every hook installed by install(), restoring the original methods.
+    """
+    while _PATCHES:
+        owner, attr, original = _PATCHES.pop()
+        if original is None:
+            delattr(owner, attr)
+        else:
+            setattr(owner, attr, original)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental decoding of observation pages, straight from the HTTP response as the bytes arrive.
+
+`Stream.filtered_observations()` reads the whole response, and parses it into a tree of Python objects, before the
+caller sees the first result, so a page of 50000 results is held in memory twice over. The helpers here request the
+same page on the shared session with `stream=True`, and decode just the `results` array of the document one result at
+a time, as each chunk of the body arrives. Results can be handled one at a time, or in batches, or decoded straight
+into the columnar buffers of examples/columnar.py.
+
+By default the body is parsed by a small parser built on `json.JSONDecoder.raw_decode()`, which decodes each result
+with the C accelerated scanner of the standard `json` module, and never holds more than one chunk and one result at a
+time. For observation pages, with many small results, this measured faster than `ijson`. The `ijson` package can be
+used instead with `backend='ijson'` if it is installed (`pip install ijson`), it is a better fit for documents with a
+few very large items.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import codecs
+import json
+from datetime import datetime
+from examples.util import require_session, get_endpoint, datetime_to_iso
+from examples.columnar import ColumnBuffer, decode_results
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DEFAULT_READ_SIZE = 65536  # bytes read from the response at a time
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BACKEND = 'python'
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+
+
+class _RawDecodeParser(object):
+    """
+    The pure Python parser. Walks the top level object of the document, decoding the value of each key whole with
+    `raw_decode()`, except for the `results` array, whose items are decoded and returned one at a time.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._current = None  # the key whose value is being read
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._state = 'start'  # start, key, colon, value, items, item_sep, done
+
+    def _skip_ws(self):
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _decode(self, final):
+        # A value is only taken once a delimiter follows it, or the input is finished, so a number split across two
+        # chunks (eg. '-1500' of '-1500.0') is never taken half way through
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except ValueError:
+            if final:
+                raise
+            return False, None
+        if not final and (end >= len(self._buf) or self._buf[end] not in _DELIMITERS):
+            return False, None
+        self._pos = end
+        return True, value
+
+    def feed(self, data, final=False):
+        """
+        :param data: the next bytes of the document
+        :param final: True when there is no more data to come
+        :return: list of the items of the array which were completed by this data
+        """
+        # Only the unparsed tail of the last chunk is kept, at most part of one item
+        self._buf = self._buf[self._pos:] + self._text.decode(data, final)
+        self._pos = 0
+        items = []
+        while True:
+            c = self._skip_ws()
+            state = self._state
+            if state == 'done':
+                break
+            if c is None:
+                break
+            if state == 'start':
+                if c != '{':
+                    raise ValueError("Expected a JSON object at position {:d}".format(self._pos))
+                self._pos += 1
+                self._state = 'key'
+            elif state == 'key':
+                if c == '}':
+                    self._pos += 1
+                    self._state = 'done'
+                    continue
+                if c == ',':
+                    self._pos += 1
+                    continue
+                ok, self._current = self._decode(final)
+                if not ok:
+                    break
+                self._state = 'colon'
+            elif state == 'colon':
+                if c != ':':
+                    raise ValueError("Expected ':' at position {:d}".format(self._pos))
+                self._pos += 1
+                self._state = 'value'
+            elif state == 'value':
+                if self._current == self.key and c == '[':
+                    self._pos += 1
+                    self._state = 'items'
+                    continue
+                ok, _ = self._decode(final)
+                if not ok:
+                    break
+                self._state = 'key'
+            elif state in ('items', 'item_sep'):
+                if c == ']':
+                    self._pos += 1
+                    self._state = 'key'
+                    continue
+                if state == 'item_sep':
+                    if c != ',':
+                        raise ValueError("Expected ',' at position {:d}".format(self._pos))
+                    self._pos += 1
+                    self._state = 'items'
+                    continue
+                ok, item = self._decode(final)
+                if not ok:
+                    break
+                items.append(item)
+                self._state = 'item_sep'
+        if final and self._state != 'done':
+            raise ValueError("The JSON document ended early.")
+        return items
+
+
+def _iter_items_raw(chunks, key):
+    parser = _RawDecodeParser(key)
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.feed(b'', final=True):
+        yield item
+
+
+def _iter_items_ijson(chunks, key):
+    items = ijson.sendable_list()
+    coro = ijson.items_coro(items, key + '.item', use_float=True)
+    for chunk in chunks:
+        coro.send(chunk)
+        for item in items:
+            yield item
+        del items[:]
+    coro.close()
+    for item in items:
+        yield item
+
+
+def iter_json_items(chunks, key='results', backend=None):
+    """
+    Incrementally decode the items of one array in a JSON document, eg. the `results` of an observations page.
+    :param chunks: iterable of bytes, eg. `response.iter_content()`
+    :param key: the top level key of the array
+    :param backend: 'python' (the default) or 'ijson'
+    :return: generator of the decoded items
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'ijson':
+        if ijson is None:
+            raise ImportError("The ijson backend needs the ijson package, pip install ijson")
+        return _iter_items_ijson(chunks, key)
+    if backend == 'python':
+        return _iter_items_raw(chunks, key)
+    raise ValueError("Unknown JSON backend: {:s}".format(repr(backend)))
+
+
+def open_observations(stream_id, start=None, end=None, limit=DEFAULT_BATCH_SIZE):
+    """
+    Request one page of observation results from the shared session, without reading the body.
+    This is the same request `Stream.filtered_observations()` makes.
+    :param stream_id: str
+    :param start: datetime, the first time to read from
+    :param end: datetime, the last time to read to (inclusive)
+    :param limit: the maximum number of results in the page
+    :return: a streamed `requests.Response`, the caller must close it
+    :raises RuntimeError: if there is no shared, authenticated session, see examples.util.require_session()
+    """
+    session = require_session()
+    params = {'streamid': stream_id, 'limit': limit, 'start': datetime_to_iso(start or datetime.min)}
+    if end is not None:
+        params['end'] = datetime_to_iso(end)
+    response = session.get(get_endpoint() + "/observations", params=params, stream=True,
+                           headers={'Accept': 'application/json'})
+    if response.status_code == 404:
+        response.close()
+        raise KeyError(stream_id)
+    response.raise_for_status()
+    return response
+
+
+def iter_page_results(stream_id, start=None, end=None, limit=DEFAULT_BATCH_SIZE, backend=None,
+                      read_size=DEFAULT_READ_SIZE):
+    """
+    Generator over the results of one page of observations, each one decoded as soon as its bytes have arrived.
+    :param stream_id: str
+    :param start: datetime, the first time to read from
+    :param end: datetime, the last time to read to (inclusive)
+    :param limit: the maximum number of results in the page, this can be far larger than the usual 1000
+    :param backend: the JSON backend, see `iter_json_items()`
+    :param read_size: the number of bytes to read from the response at a time
+    :return: generator of result dicts, like `{'t': '2017-01-01T00:00:00.000Z', 'v': {'v': 1.0}}`
+    """
+    response = open_observations(stream_id, start, end, limit)
+    try:
+        for result in iter_json_items(response.iter_content(read_size), 'results', backend):
+            yield result
+    finally:
+        response.close()
+
+
+def iter_result_batches(stream_id, start=None, end=None, limit=DEFAULT_BATCH_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                        backend=None, read_size=DEFAULT_READ_SIZE):
+    """
+    Like `iter_page_results()`, but in lists of up to batch_size results, for vectorised decoding.
+    :return: generator of lists of result dicts
+    """
+    batch = []
+    for result in iter_page_results(stream_id, start, end, limit, backend, read_size):
+        batch.append(result)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_page_columns(stream_id, start=None, end=None, limit=DEFAULT_BATCH_SIZE, buffer=None,
+                      batch_size=DEFAULT_BATCH_SIZE, backend=None, read_size=DEFAULT_READ_SIZE):
+    """
+    Decode one page of observations straight into columnar time and value arrays, a batch at a time, so the page is
+    never held as a list of dicts.
+    :param buffer: a ColumnBuffer to append to, a new one is made if not given
+    :return: the ColumnBuffer
+    """
+    buffer = buffer if buffer is not None else ColumnBuffer(min(limit, 65536))
+    for batch in iter_result_batches(stream_id, start, end, limit, batch_size, backend, read_size):
+        buffer.append(*decode_results(batch))
+    return buffer
+
+
+def iter_page_columns(stream_id, start=None, end=None, limit=DEFAULT_BATCH_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                      backend=None, read_size=DEFAULT_READ_SIZE):
+    """
+    Generator over every page of observations from start to end, each decoded by `read_page_columns()`.
+    Like `examples.observations.iter_observation_pages()`, each page is requested starting exactly at the newest time
+    of the previous page, and the repeated results at or before that time are dropped.
+    :param stream_id: str
+    :param start: datetime, read results at or after this time, defaults to the start of the stream
+    :param end: datetime, stop reading at this time (inclusive), defaults to the end of the stream
+    :param limit: the maximum number of results in each page
+    :return: generator of (times, values) numpy arrays, one pair per page
+    """
+    offset = start
+    position = None  # the newest time seen so far, the cursor
+    while True:
+        page = read_page_columns(stream_id, offset, end, limit, None, batch_size, backend, read_size)
+        times, values = page.times, page.values
+        if position is not None:
+            keep = times > position
+            times, values = times[keep], values[keep]
+        if len(times) < 1:
+            return
+        yield times, values
+        position = times.max()
+        offset = position.item()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A local, in-memory stand-in for a SensorCloud endpoint, for running and measuring the examples offline.
+
+It serves HAL+JSON for the parts of the SensorCloud API which the examples use: organisations, locations, groups,
+streams (including the paginated stream index with `next` links) and observations. It is not a complete or exact
+implementation of SensorCloud, and it does not check credentials.
+Request latency and the size of the seeded data are configurable, and every request is timed, so it can be used as a
+repeatable target for benchmarks, see benchmark.py.
+
+Run it on its own with:
+python3 -m examples.local_server
+and then point the SC_ENDPOINT in any example's CONSTS at the printed endpoint.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import bisect
+import gzip
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs, urlencode
+from examples.util import datetime_to_iso, datetime_from_iso
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+CONSTS['HOST'] = "127.0.0.1"
+CONSTS['PORT'] = 8080
+CONSTS['LATENCY'] = 0.02  # seconds of simulated latency added to every request
+CONSTS['STREAMS'] = 200  # the number of streams to seed into the organisation
+CONSTS['OBSERVATIONS'] = 5000  # the number of observations to seed into each stream
+CONSTS['PAGE_SIZE'] = 100  # the page size of the stream and group indexes
+
+API_PREFIX = "/api/sensor/v2"
+# Requests to these paths control the server itself, they are not timed or counted
+CONTROL_PREFIX = "/_local"
+DEFAULT_OBSERVATION_LIMIT = 1000
+MAX_OBSERVATION_LIMIT = 10000
+GZIP_MIN_SIZE = 1024  # gzip response bodies at least this big, when the client accepts it
+_SEED_INTERPOLATION_TYPE = "http://www.opengis.net/def/waterml/2.0/interpolationType/Discontinuous"
+_SEED_OBSERVED_PROPERTY = "http://data.sense-t.org.au/registry/def/sop/soil_moisture"
+_SEED_UNIT_OF_MEASURE = "http://registry.it.csiro.au/def/environment/unit/CubicMetresPerCubicMetre"
+
+
+class ServerStats(object):
+    """
+    Counts and times every request handled by the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes_sent = 0
+            self.durations = []
+
+    def record(self, duration, status, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+            self.durations.append(duration)
+            if status >= 400:
+                self.errors += 1
+
+
+class SensorCloudStore(object):
+    """
+    The in-memory data behind the local server.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.organisations = {}
+        self.locations = {}
+        self.groups = {}
+        self.streams = {}
+        self.observation_times = {}  # stream_id -> sorted list of datetime
+        self.observation_results = {}  # stream_id -> list of result dicts, in the same order as observation_times
+
+    def seed(self, org_id="csiro", streams=200, observations=5000, groups=10, location_id="brisbane.esp.site.1"):
+        """
+        Fill the store with an organisation, a location, some groups, and streams of hourly scalar observations.
+        """
+        with self.lock:
+            self.organisations[org_id] = {"id": org_id, "name": org_id.upper()}
+            self.locations[location_id] = {"id": location_id, "organisationid": org_id,
+                                           "description": "Seeded location",
+                                           "geoJson": {"type": "Point", "coordinates": [153.030034, -27.494743]}}
+            for i in range(groups):
+                group_id = "group.{:d}".format(i)
+                self.groups[group_id] = {"id": group_id, "name": group_id, "description": "Seeded group",
+                                         "organisationid": org_id}
+            start = datetime(2015, 1, 1)
+            for i in range(streams):
+                stream_id = "my.stream.{:d}".format(i + 1)
+                self.streams[stream_id] = {
+                    "id": stream_id, "name": stream_id, "description": "Seeded stream",
+                    "organisationid": org_id, "locationid": location_id, "resultType": "scalarvalue",
+                    "reportingPeriod": "PT1H", "samplePeriod": "PT1H",
+                    "streamMetadata": {"type": ".ScalarStreamMetaData", "cumulative": False,
+                                       "interpolationType": _SEED_INTERPOLATION_TYPE,
+                                       "observedProperty": _SEED_OBSERVED_PROPERTY,
+                                       "unitOfMeasure": _SEED_UNIT_OF_MEASURE}}
+                times = [start + timedelta(hours=h) for h in range(observations)]
+                self.observation_times[stream_id] = times
+                self.observation_results[stream_id] = [{"t": datetime_to_iso(t), "v": {"v": random.random() * 10.0}}
+                                                       for t in times]
+
+    def add_results(self, stream_id, results):
+        with self.lock:
+            times = self.observation_times.setdefault(stream_id, [])
+            stored = self.observation_results.setdefault(stream_id, [])
+            for r in results:
+                t = datetime_from_iso(r['t'])
+                i = bisect.bisect_left(times, t)
+                if i < len(times) and times[i] == t:
+                    stored[i] = r
+                else:
+                    times.insert(i, t)
+                    stored.insert(i, r)
+
+    def get_results(self, stream_id, start=None, end=None, limit=DEFAULT_OBSERVATION_LIMIT):
+        with self.lock:
+            times = self.observation_times.get(stream_id, [])
+            lo = bisect.bisect_left(times, start) if start is not None else 0
+            hi = bisect.bisect_right(times, end) if end is not None else len(times)
+            hi = min(hi, lo + limit)
+            return self.observation_results[stream_id][lo:hi] if stream_id in self.observation_results else []
+
+
+def _org_of(doc):
+    return doc.get("organisationid", doc.get("organisation_id"))
+
+
+class SensorCloudRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes requests to the in-memory store, and renders the responses as HAL+JSON.
+    """
+    protocol_version = "HTTP/1.1"  # Keep connections alive, the same as a real endpoint would
+    disable_nagle_algorithm = True  # Otherwise small responses on a kept-alive connection stall on delayed ACKs
+    _ENTITY = re.compile(r"^/(organisations|locations|groups|streams)/([^/]+)$")
+    _INDEX = re.compile(r"^/(organisations|locations|groups|streams)/?$")
+    _OBSERVATIONS = re.compile(r"^/observations/?$")
+
+    def log_message(self, format, *args):
+        # Don't print a line per request, it would swamp the benchmark output
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def _href(self, path, query=None):
+        href = API_PREFIX + path
+        if query:
+            href += "?" + urlencode(query)
+        return {"href": href}
+
+    def _send(self, status, doc=None, headers=None):
+        body = json.dumps(doc).encode("utf-8") if doc is not None else b""
+        headers = dict(headers or {})
+        if status == 200 and self.command == "GET" and body:
+            etag = '"{:s}"'.format(hashlib.md5(body).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            headers["ETag"] = etag
+        if len(body) >= GZIP_MIN_SIZE and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/hal+json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+        self._sent = len(body)
+        self._status = status
+
+    def _not_found(self):
+        self._send(404, {"message": "Not found: {:s}".format(self.path)})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 1:
+            return {}
+        doc = json.loads(self.rfile.read(length).decode("utf-8"))
+        if not isinstance(doc, dict):
+            raise ValueError("The request body must be a JSON object.")
+        return doc
+
+    def _entity_doc(self, collection, doc):
+        out = dict(doc)
+        links = {"self": self._href("/{:s}/{:s}".format(collection, doc["id"]))}
+        org_id = _org_of(doc)
+        if org_id and collection != "organisations":
+            links["organisation"] = self._href("/organisations/{:s}".format(org_id))
+        if collection == "streams":
+            location_id = doc.get("locationid", doc.get("location_id"))
+            if location_id:
+                links["location"] = self._href("/locations/{:s}".format(location_id))
+            links["observations"] = self._href("/observations", {"streamid": doc["id"]})
+        out["_links"] = links
+        return out
+
+    def _index_doc(self, collection, query):
+        with self.store.lock:
+            items = sorted(getattr(self.store, collection).values(), key=lambda d: d["id"])
+        org_id = query.get("organisation_id", query.get("organisationid"))
+        if org_id:
+            items = [d for d in items if _org_of(d) == org_id or (collection == "organisations" and d["id"] == org_id)]
+        skip = int(query.get("skip", 0))
+        limit = int(query.get("limit", self.server.page_size))
+        page = items[skip:skip + limit]
+        links = {"self": self._href("/" + collection, dict(query, skip=skip, limit=limit)),
+                 collection: [self._href("/{:s}/{:s}".format(collection, d["id"])) for d in page]}
+        if skip + limit < len(items):
+            links["next"] = self._href("/" + collection, dict(query, skip=skip + limit, limit=limit))
+        return {"_links": links, "count": len(page), "totalCount": len(items)}
+
+    def _observations_doc(self, query):
+        stream_id = query.get("streamid", query.get("stream_id"))
+        if not stream_id:
+            raise ValueError("The streamid parameter is required.")
+        start = datetime_from_iso(query["start"]) if query.get("start") else None
+        end = datetime_from_iso(query["end"]) if query.get("end") else None
+        limit = min(int(query.get("limit", DEFAULT_OBSERVATION_LIMIT)), MAX_OBSERVATION_LIMIT)
+        results = self.store.get_results(stream_id, start, end, limit)
+        return {"_links": {"self": self._href("/observations", query),
+                           "stream": self._href("/streams/{:s}".format(stream_id))},
+                "stream": stream_id, "results": results}
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        return path, query
+
+    def _control(self):
+        if self.path == CONTROL_PREFIX + "/stats" and self.command == "GET":
+            stats = self.server.stats
+            with stats._lock:
+                doc = {"requests": stats.requests, "errors": stats.errors, "bytes_sent": stats.bytes_sent,
+                       "durations": list(stats.durations)}
+            return self._send(200, doc)
+        if self.path == CONTROL_PREFIX + "/reset" and self.command == "POST":
+            self._read_json()
+            self.server.stats.reset()
+            return self._send(200, {})
+        return self._not_found()
+
+    def _handle(self):
+        if self.path.startswith(CONTROL_PREFIX):
+            return self._control()
+        started = time.time()
+        self._sent = 0
+        self._status = 500
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            try:
+                self._dispatch()
+            except (ValueError, KeyError) as e:
+                self._send(400, {"message": "Bad request: {:s}".format(repr(e))})
+        finally:
+            self.server.stats.record(time.time() - started, self._status, self._sent)
+
+    def _dispatch(self):
+        path, query = self._route()
+        method = self.command
+        m = self._ENTITY.match(path)
+        if m:
+            collection, entity_id = m.groups()
+            table = getattr(self.store, collection)
+            if method == "GET":
+                with self.store.lock:
+                    doc = table.get(entity_id)
+                return self._send(200, self._entity_doc(collection, doc)) if doc else self._not_found()
+            if method in ("PUT", "POST"):
+                doc = self._read_json()
+                doc["id"] = entity_id
+                doc.pop("_links", None)
+                with self.store.lock:
+                    table[entity_id] = doc
+                return self._send(200, self._entity_doc(collection, doc))
+            if method == "DELETE":
+                with self.store.lock:
+                    found = table.pop(entity_id, None)
+                return self._send(200, self._entity_doc(collection, found)) if found else self._not_found()
+        m = self._INDEX.match(path)
+        if m and method == "GET":
+            return self._send(200, self._index_doc(m.group(1), query))
+        if self._OBSERVATIONS.match(path):
+            if method == "GET":
+                return self._send(200, self._observations_doc(query))
+            if method in ("POST", "PUT"):
+                stream_id = query.get("streamid", query.get("stream_id"))
+                doc = self._read_json()
+                stream_id = stream_id or doc.get("streamid") or doc.get("stream")
+                if stream_id not in self.store.streams:
+                    return self._not_found()
+                results = doc.get("results", [])
+                self.store.add_results(stream_id, results)
+                return self._send(200, {"_links": {"self": self._href("/observations", {"streamid": stream_id})},
+                                        "stream": stream_id, "count": len(results)})
+        return self._not_found()
+
+    do_GET = _handle
+    do_PUT = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class LocalSensorCloud(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server hosting a `SensorCloudStore`. Use `start()` to serve from a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, page_size=None, store=None):
+        """
+        :param host: the interface to listen on
+        :param port: the port to listen on, 0 picks a free port
+        :param latency: seconds of simulated latency added to every request
+        :param page_size: the page size of the stream and group indexes, defaults to CONSTS['PAGE_SIZE']
+        :param store: a `SensorCloudStore`, a new empty one is used if not given
+        """
+        HTTPServer.__init__(self, (host, port), SensorCloudRequestHandler)
+        self.latency = latency
+        self.page_size = page_size if page_size is not None else CONSTS['PAGE_SIZE']
+        self.store = store if store is not None else SensorCloudStore()
+        self.stats = ServerStats()
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return "http://{:s}:{:d}{:s}".format(host, port, API_PREFIX)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="local-sensorcloud", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _serve(host, port, latency, page_size, streams, observations, ready):
+    store = SensorCloudStore()
+    store.seed(streams=streams, observations=observations)
+    server = LocalSensorCloud(host, port, latency=latency, page_size=page_size, store=store)
+    ready.put(server.endpoint)
+    server.serve_forever()
+
+
+def start_process(host="127.0.0.1", port=0, latency=0.0, page_size=None, streams=200,
+                  observations=5000):
+    """
+    Seed a store and serve it from a separate process, so the server does not compete with the code being measured
+    for the GIL, or show up in its memory use.
+    Use `GET /_local/stats` and `POST /_local/reset` on the server's host to read and reset its stats.
+    :return: tuple of (multiprocessing.Process, endpoint url)
+    """
+    import multiprocessing
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, name="local-sensorcloud", daemon=True,
+                                      args=(host, port, latency, page_size, streams, observations, ready))
+    process.start()
+    return process, ready.get(timeout=120)
+
+
+def main():
+    """
+    Entrypoint for running the local server on its own
+    :return:
+    """
+    store = SensorCloudStore()
+    store.seed(streams=CONSTS['STREAMS'], observations=CONSTS['OBSERVATIONS'])
+    server = LocalSensorCloud(CONSTS['HOST'], CONSTS['PORT'], latency=CONSTS['LATENCY'],
+                              page_size=CONSTS['PAGE_SIZE'], store=store)
+    print("Serving a local SensorCloud stand-in at {:s}".format(server.endpoint))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
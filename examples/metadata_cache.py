@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+A client side cache of SensorCloud metadata lookups, such as `Organisation.single()`, `Location.single()`,
+`Group.single()` and `Group.resolve_all()`.
+
+Most examples start with one or more existence checks, and long running jobs repeat those same checks thousands of
+times. `MetadataCache` keeps the results of these lookups for a limited time (TTL), and evicts the least recently used
+entries once it is full. Saving or deleting an entity through the cache invalidates the cached entries for it, and
+for any `resolve_all()` listings of that model.
+
+For revalidation once an entry expires, set up `pysc` with `revalidate=True` (see examples.util), then an expired
+lookup is answered with a cheap 304 Not Modified by any server which supports ETags.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300.0  # seconds
+DEFAULT_MAX_ENTRIES = 4096
+
+
+class MetadataCache(object):
+    """
+    A thread-safe TTL and LRU cache of `pysc` model lookups.
+    Missing entities (a KeyError from `.single()`) are not cached, so an entity created elsewhere is found straight
+    away.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        """
+        :param ttl: the number of seconds a lookup is kept for
+        :param max_entries: the maximum number of lookups kept, the least recently used are evicted first
+        :param clock: the time source, in seconds
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expiry time, value)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _model_name(model_cls):
+        return model_cls.__name__
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def single(self, model_cls, entity_id):
+        """
+        A cached equivalent of `model_cls.single(entity_id)`.
+        :param model_cls: a `pysc.models` class, eg. `pysc.models.Organisation`
+        :param entity_id: str
+        :return: the model object
+        :raises KeyError: if the entity does not exist, the same as `.single()`
+        """
+        key = (self._model_name(model_cls), 'single', entity_id)
+        found, value = self._get(key)
+        if found:
+            return value
+        value = model_cls.single(entity_id)
+        self._put(key, value)
+        return value
+
+    def resolve_all(self, model_cls, params=None):
+        """
+        A cached equivalent of `model_cls.resolve_all(params=params)`.
+        :param model_cls: a `pysc.models` class, eg. `pysc.models.Group`
+        :param params: dict of query parameters, eg. {'organisation_id': 'csiro'}
+        :return: list of model objects
+        """
+        key = (self._model_name(model_cls), 'resolve_all', tuple(sorted((params or {}).items())))
+        found, value = self._get(key)
+        if found:
+            return value
+        value = model_cls.resolve_all(params=params)
+        self._put(key, value)
+        return value
+
+    def save(self, obj):
+        """
+        Save a model object to SensorCloud with `obj.save()`, and invalidate the cached entries it affects.
+        The saved object returned by SensorCloud is cached.
+        :param obj: a `pysc.models` object
+        :return: the saved model object returned from `obj.save()`
+        """
+        saved = obj.save()
+        model_cls = type(obj)
+        self.invalidate(model_cls, obj.id)
+        if saved is not None:
+            self._put((self._model_name(model_cls), 'single', saved.id), saved)
+        return saved
+
+    def delete(self, model_cls, entity_id, *args, **kwargs):
+        """
+        Delete an entity with `model_cls.delete(entity_id, ...)`, and invalidate the cached entries it affects.
+        :param model_cls: a `pysc.models` class
+        :param entity_id: str
+        :return: the return value of `model_cls.delete()`
+        """
+        try:
+            return model_cls.delete(entity_id, *args, **kwargs)
+        finally:
+            self.invalidate(model_cls, entity_id)
+
+    def invalidate(self, model_cls, entity_id=None):
+        """
+        Forget the cached lookup of one entity, and every cached `resolve_all()` listing of its model.
+        If entity_id is None, forget every cached entry for the model.
+        """
+        name = self._model_name(model_cls)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] != name:
+                    continue
+                if entity_id is None or key[1] == 'resolve_all' or key[2] == entity_id:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+A local, persistent cache of observation results, stored in an SQLite database.
+
+Each stream has a high-watermark, which is the timestamp of the newest result we have stored for that stream. Syncing
+a stream only asks SensorCloud for results at or after its watermark, so repeated runs only download new data, and
+range reads are answered from the local database without going to the server at all.
+
+Only scalar streams are supported, values are stored as floats.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from examples.util import datetime_from_iso
+from examples.columnar import unwrap_value
+
+DEFAULT_CHUNK_SIZE = 1000
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    stream_id TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    v REAL,
+    PRIMARY KEY (stream_id, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS watermarks (
+    stream_id TEXT PRIMARY KEY NOT NULL,
+    t INTEGER NOT NULL
+);
+"""
+
+
+def _to_micros(_d):
+    # Timestamps are stored as integer microseconds since the unix epoch, so they sort and compare cheaply
+    return (_d - _EPOCH) // _ONE_MICROSECOND
+
+
+def _from_micros(_t):
+    return _EPOCH + timedelta(microseconds=_t)
+
+
+class ObservationCache(object):
+    """
+    An on-disk store of observation results, keyed by stream id, with a per-stream high-watermark.
+    Can be used as a context manager, to close the database when done.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the filename of the SQLite database, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def watermark(self, stream_id):
+        """
+        :param stream_id: str
+        :return: the datetime of the newest stored result for the stream, or None if nothing is stored
+        """
+        with self._lock:
+            row = self._db.execute("SELECT t FROM watermarks WHERE stream_id = ?", (stream_id,)).fetchone()
+        return None if row is None else _from_micros(row[0])
+
+    def add_results(self, stream_id, results):
+        """
+        Store a page of observation results for a stream, and advance its watermark.
+        Results that are already stored are replaced, so overlapping pages are harmless.
+        :param stream_id: str
+        :param results: list of result dicts, eg. `Observation.results`
+        :return: the number of results stored
+        """
+        return self._insert(stream_id, self._rows(stream_id, results))
+
+    @staticmethod
+    def _rows(stream_id, results):
+        return [(stream_id, _to_micros(datetime_from_iso(r['t'])), unwrap_value(r['v'])) for r in results]
+
+    def _insert(self, stream_id, rows):
+        if not rows:
+            return 0
+        newest = max(r[1] for r in rows)
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO observations (stream_id, t, v) VALUES (?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO watermarks (stream_id, t) "
+                             "SELECT ?, max(?, coalesce((SELECT t FROM watermarks WHERE stream_id = ?), ?))",
+                             (stream_id, newest, stream_id, newest))
+        return len(rows)
+
+    def sync(self, stream, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Download any results on the stream newer than its watermark, and store them.
+        The request starts exactly at the watermark rather than after it, so results which share the watermark's
+        second are not skipped. Any overlap is de-duplicated by the database.
+        :param stream: a `pysc.models.Stream`
+        :param chunk_size: the maximum number of results to request per page
+        :return: the number of new results, newer than the watermark before the sync
+        """
+        stream_id = stream.id
+        offset = self.watermark(stream_id) or datetime.min
+        # Results at or before the old watermark were already stored, they are re-read but not counted
+        previous = _to_micros(offset)
+        received = 0
+        while True:
+            obs = stream.filtered_observations(limit=chunk_size, start=offset)
+            rows = self._rows(stream_id, obs.results)
+            if len(rows) < 1:
+                break
+            self._insert(stream_id, rows)
+            received += sum(1 for r in rows if r[1] > previous)
+            last_time = self.watermark(stream_id)
+            if last_time <= offset:
+                # Nothing newer than the start of this page, we are up to date.
+                break
+            offset = last_time
+            previous = _to_micros(offset)
+        return received
+
+    def read(self, stream_id, start=None, end=None):
+        """
+        Read stored results for a stream, in time order, from the local database only.
+        :param stream_id: str
+        :param start: datetime, include results at or after this time
+        :param end: datetime, include results at or before this time
+        :return: list of (datetime, value) tuples
+        """
+        return [(_from_micros(t), v) for t, v in self._select(stream_id, start, end)]
+
+    def read_columns(self, stream_id, start=None, end=None):
+        """
+        Read stored results for a stream, in time order, as numpy columns.
+        :param stream_id: str
+        :param start: datetime, include results at or after this time
+        :param end: datetime, include results at or before this time
+        :return: tuple of (datetime64[us] array, float64 array)
+        """
+        import numpy as np
+        rows = self._select(stream_id, start, end)
+        if not rows:
+            return np.empty(0, dtype='datetime64[us]'), np.empty(0, dtype='float64')
+        times, values = zip(*rows)
+        return (np.array(times, dtype='int64').view('datetime64[us]'),
+                np.array(values, dtype='float64'))
+
+    def _select(self, stream_id, start, end):
+        lo = _to_micros(start) if start is not None else -(2 ** 63)
+        hi = _to_micros(end) if end is not None else 2 ** 63 - 1
+        with self._lock:
+            return self._db.execute("SELECT t, v FROM observations "
+                                    "WHERE stream_id = ? AND t BETWEEN ? AND ? ORDER BY t",
+                                    (stream_id, lo, hi)).fetchall()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+An array-backed builder for uploading observation results, with direct serialisation to JSON bytes.
+
+The add_observations.py example builds a dict per result, with a nested `{"v": value}` dict and a formatted timestamp
+string, and `Observation.save()` then serialises the whole list. For large backfills that costs more than the upload,
+and the per-result objects take several hundred bytes each.
+
+`ObservationBuilder` keeps the results in two typed columns (see `ColumnBuffer` in examples/columnar.py), filled
+from NumPy arrays or one result at a time. `encode_results()` writes the
+`{"results": [{"t": "...", "v": {"v": ...}}, ...]}` payload in one pass of vectorised NumPy operations. The timestamps
+and values are formatted by NumPy's C formatting code, and the rows are assembled as one byte array, so no Python
+object is made per result. The payload is posted on the shared session to the same `/observations?streamid=` endpoint
+that `Observation.save()` uses.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import numpy as np
+from examples.util import require_session, get_endpoint
+from examples.columnar import ColumnBuffer, TIME_DTYPE, VALUE_DTYPE
+
+DEFAULT_BATCH_COUNT = 5000  # the maximum number of results uploaded in one request
+
+_PREFIX = b'{"t":"'
+_MIDDLE = b'Z","v":{"v":'
+_SUFFIX = b'}},'
+_TIME_WIDTH = 26  # 'YYYY-MM-DDTHH:MM:SS.ffffff'
+_VALUE_WIDTH = 32  # wider than the longest shortest-round-trip float64, eg. '-2.2250738585072014e-308'
+_BLOCK_ROWS = 16384  # rows encoded at a time
+
+
+def _encode_block(times, values):
+    # Format each column in C, into fixed width byte strings
+    n = len(times)
+    time_bytes = np.datetime_as_string(times, unit='us').astype('S{:d}'.format(_TIME_WIDTH))
+    value_bytes = values.astype('S{:d}'.format(_VALUE_WIDTH))
+    non_finite = ~np.isfinite(values)
+    if non_finite.any():
+        value_bytes[non_finite] = b'null'
+    value_lengths = np.char.str_len(value_bytes)
+
+    # Lay every row out at a fixed width, then keep only the used bytes of each value, which flattens the rows
+    # into one contiguous run of bytes
+    p, m = len(_PREFIX), len(_MIDDLE)
+    width = p + _TIME_WIDTH + m + _VALUE_WIDTH + len(_SUFFIX)
+    rows = np.empty((n, width), dtype=np.uint8)
+    rows[:, :p] = np.frombuffer(_PREFIX, dtype=np.uint8)
+    rows[:, p:p + _TIME_WIDTH] = time_bytes.view(np.uint8).reshape(n, _TIME_WIDTH)
+    at = p + _TIME_WIDTH
+    rows[:, at:at + m] = np.frombuffer(_MIDDLE, dtype=np.uint8)
+    at += m
+    rows[:, at:at + _VALUE_WIDTH] = value_bytes.view(np.uint8).reshape(n, _VALUE_WIDTH)
+    rows[:, at + _VALUE_WIDTH:] = np.frombuffer(_SUFFIX, dtype=np.uint8)
+    keep = np.ones((n, width), dtype=bool)
+    keep[:, at:at + _VALUE_WIDTH] = np.arange(_VALUE_WIDTH) < value_lengths[:, None]
+    return rows[keep].tobytes()
+
+
+def encode_results(times, values):
+    """
+    Serialise observation results straight to the JSON bytes of an observation upload.
+    The rows are encoded in blocks, so the working memory stays small however many results there are.
+    NaN and infinite values are written as null.
+    :param times: array-like of datetime64 (converted to microsecond precision), in UTC
+    :param values: array-like of float
+    :return: bytes, eg. b'{"results":[{"t":"2017-01-01T00:00:00.000000Z","v":{"v":1.5}}]}'
+    :raises ValueError: if the lengths differ, or a time is NaT
+    """
+    times = np.asarray(times, dtype=TIME_DTYPE)
+    values = np.asarray(values, dtype=VALUE_DTYPE)
+    n = len(times)
+    if n != len(values):
+        raise ValueError("times and values must be the same length.")
+    if n == 0:
+        return b'{"results":[]}'
+    if np.isnat(times).any():
+        raise ValueError("Observation times can not be NaT.")
+    parts = [b'{"results":[']
+    parts.extend(_encode_block(times[i:i + _BLOCK_ROWS], values[i:i + _BLOCK_ROWS]) for i in range(0, n, _BLOCK_ROWS))
+    # Drop the trailing comma of the last row
+    parts[-1] = parts[-1][:-1]
+    parts.append(b']}')
+    return b''.join(parts)
+
+
+def post_results(stream_id, payload):
+    """
+    Upload an already encoded payload of observation results to a stream, on the shared session.
+    Failed requests are retried by the session's rate controller, when it has one.
+    :param stream_id: str
+    :param payload: bytes, from `encode_results()`
+    :return: the `requests.Response`
+    :raises requests.HTTPError: if the upload failed
+    :raises RuntimeError: if there is no shared, authenticated session
+    """
+    response = require_session().post(get_endpoint() + "/observations", params={'streamid': stream_id},
+                                      data=payload, headers={'Content-Type': 'application/json'})
+    response.raise_for_status()
+    return response
+
+
+class ObservationBuilder(object):
+    """
+    Collects observation results for one stream in typed time and value columns, and uploads them in batches.
+    """
+
+    def __init__(self, stream_id, capacity=1024):
+        """
+        :param stream_id: the stream to upload to
+        :param capacity: the initial number of results to make room for, the columns grow as needed
+        """
+        self.stream_id = stream_id
+        self._buffer = ColumnBuffer(capacity)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    @property
+    def times(self):
+        return self._buffer.times
+
+    @property
+    def values(self):
+        return self._buffer.values
+
+    def extend(self, times, values):
+        """
+        Add arrays of results.
+        :param times: array-like of datetime64, in UTC
+        :param values: array-like of float
+        :return: the number of results added
+        """
+        return self._buffer.append(np.asarray(times, dtype=TIME_DTYPE), np.asarray(values, dtype=VALUE_DTYPE))
+
+    def append(self, time, value):
+        """
+        Add one result, straight into the columns.
+        :param time: datetime (naive, in UTC) or datetime64
+        :param value: float
+        """
+        self._buffer.append_row(time, value)
+
+    def clear(self):
+        self._buffer = ColumnBuffer(self._buffer.capacity)
+
+    def encode(self, start=0, stop=None):
+        """
+        :return: the JSON payload bytes of the results from start to stop, see `encode_results()`
+        """
+        return encode_results(self.times[start:stop], self.values[start:stop])
+
+    def save(self, max_count=DEFAULT_BATCH_COUNT):
+        """
+        Upload every result in the builder, in batches of up to max_count results, then empty the builder.
+        Only one batch is encoded at a time. If a batch fails the error is raised and every result is kept, sending
+        the earlier batches again is harmless, as a stream holds one result per timestamp.
+        :param max_count: the maximum number of results per request
+        :return: the number of results uploaded
+        """
+        n = len(self)
+        for start in range(0, n, max_count):
+            post_results(self.stream_id, self.encode(start, start + max_count))
+        self.clear()
+        return n
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for reading observation results back from a `pysc` Stream.
+
+The get_observations_from_stream.py example reads a stream one page at a time, where each request depends on the last
+timestamp of the previous page. For long-lived streams that is limited by round trip latency rather than bandwidth,
+so the helpers here can split a time range into disjoint windows and read the windows concurrently.
+
+`iter_observations()` hides the pagination behind a generator, and downloads the next page in the background while
+the caller is still working on the current one.
+
+Pagination resumes exactly at the last timestamp seen, rather than one second after it, so sub-second observations
+are never skipped, and the repeated result at each page boundary is dropped (a stream holds one result per timestamp).
+The page size can be adapted to the observed response times with `AdaptivePageSize`.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from examples.util import datetime_from_iso
+from examples.columnar import unwrap_value
+
+DEFAULT_CHUNK_SIZE = 1000
+MIN_CHUNK_SIZE = 2  # A page must hold more than the repeated boundary result to make progress
+
+
+class AdaptivePageSize(object):
+    """
+    Chooses the `limit` for each page request, growing it while responses come back quicker than the target response
+    time (so sparse or fast streams take fewer requests), and shrinking it when they are slower.
+    Optionally, the limit is also capped so that a page stays under a target response size.
+    The limit changes by at most a factor of two per page, so one slow or fast response doesn't swing it too far.
+    """
+
+    def __init__(self, initial=DEFAULT_CHUNK_SIZE, minimum=100, maximum=10000, target_seconds=1.0,
+                 target_bytes=None):
+        """
+        :param initial: the limit of the first page
+        :param minimum: the smallest limit to use
+        :param maximum: the largest limit to use, SensorCloud caps the limit of a request too
+        :param target_seconds: the response time to aim for, per page
+        :param target_bytes: if given, the approximate JSON size of a page to stay under
+        """
+        self.minimum = max(int(minimum), MIN_CHUNK_SIZE)
+        self.maximum = max(int(maximum), self.minimum)
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.limit = self._clamp(initial)
+
+    def _clamp(self, limit):
+        return int(min(max(limit, self.minimum), self.maximum))
+
+    def update(self, results, elapsed):
+        """
+        Choose the next limit, based on the page that was just received.
+        :param results: the list of results in the page
+        :param elapsed: the number of seconds the page took to arrive
+        :return: the next limit
+        """
+        count = len(results)
+        if count < self.limit:
+            # A short page is the end of the data, its time says nothing about how big the next page could be
+            return self.limit
+        limit = self.limit
+        if elapsed > 0:
+            limit = limit * min(max(self.target_seconds / elapsed, 0.5), 2.0)
+        if self.target_bytes and count:
+            result_bytes = len(json.dumps(results[-1])) + 2
+            limit = min(limit, self.target_bytes / float(result_bytes))
+        self.limit = self._clamp(limit)
+        return self.limit
+
+
+class _FixedPageSize(object):
+    # The same interface as AdaptivePageSize, for a constant limit
+    def __init__(self, limit):
+        self.limit = max(int(limit), MIN_CHUNK_SIZE)
+
+    def update(self, results, elapsed):
+        return self.limit
+
+
+def split_time_range(start, end, windows):
+    """
+    Split the time range [start, end] into a number of disjoint, contiguous windows of (roughly) equal length.
+    :param start: datetime at the start of the range
+    :param end: datetime at the end of the range
+    :param windows: the number of windows to split the range into
+    :return: list of (window_start, window_end) tuples, in time order
+    """
+    if end < start:
+        raise ValueError("The end of the time range must not be before the start.")
+    if windows < 1:
+        raise ValueError("windows must be a positive integer.")
+    span = end - start
+    step = span / windows
+    if step < timedelta(seconds=1):
+        # Don't bother splitting very short ranges into many tiny windows
+        return [(start, end)]
+    bounds = [start + (step * i) for i in range(windows)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def fetch_window(stream, start, end, chunk_size=DEFAULT_CHUNK_SIZE, inclusive_end=False):
+    """
+    Read all of the observation results on a stream between `start` and `end`, one page at a time.
+    Only results in the half-open range [start, end) are returned, unless `inclusive_end` is True.
+    :param stream: a `pysc.models.Stream`
+    :param start: datetime at the start of the window
+    :param end: datetime at the end of the window
+    :param chunk_size: the maximum number of results to request per page, or an AdaptivePageSize
+    :param inclusive_end: also include results with a timestamp exactly equal to `end`
+    :return: list of (datetime, result) tuples, in time order
+    """
+    found = []
+    for page in iter_observation_pages(stream, start, end, chunk_size, prefetch=False):
+        found.extend(tr for tr in page if inclusive_end or tr[0] < end)
+    return found
+
+
+def fetch_partitioned(stream, start, end, workers=4, windows=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read all of the observation results on a stream between `start` and `end` (inclusive), by splitting the range into
+    disjoint time windows and reading up to `workers` windows at the same time.
+    The windows are merged back together into one time-ordered list, with any duplicated timestamps removed.
+    :param stream: a `pysc.models.Stream`
+    :param start: datetime at the start of the range
+    :param end: datetime at the end of the range
+    :param workers: the maximum number of windows to read at once
+    :param windows: the number of windows to split the range into, defaults to four per worker so that a slow or
+                    dense window doesn't hold up the whole read
+    :param chunk_size: the maximum number of results to request per page, or an AdaptivePageSize
+    :return: list of result dicts, the same shape as `Observation.results`, in time order
+    """
+    if workers < 1:
+        raise ValueError("workers must be a positive integer.")
+    if windows is None:
+        windows = workers * 4
+    ranges = split_time_range(start, end, windows)
+    last_index = len(ranges) - 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_window, stream, s, e, chunk_size, i == last_index)
+                   for i, (s, e) in enumerate(ranges)]
+        window_results = [f.result() for f in futures]
+    merged = []
+    last_time = None
+    # The windows are disjoint and each is sorted, so merging them is just concatenation in window order.
+    for found in window_results:
+        found.sort(key=lambda tr: tr[0])
+        for t, r in found:
+            if last_time is not None and t <= last_time:
+                continue
+            last_time = t
+            merged.append(r)
+    return merged
+
+
+def _fetch_page(stream, offset, end, limit):
+    started = time.time()
+    if end is None:
+        obs = stream.filtered_observations(limit=limit, start=offset)
+    else:
+        obs = stream.filtered_observations(limit=limit, start=offset, end=end)
+    return obs.results, time.time() - started
+
+
+def iter_observation_pages(stream, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE, prefetch=True):
+    """
+    Generator over the pages of observation results on a stream, in time order.
+    Each page is requested starting exactly at the newest timestamp of the previous page, and the results at or before
+    that timestamp are dropped, so no result is skipped or repeated, however close together the results are.
+    As soon as a page arrives, the request for the following page is started in the background, so the download of
+    page N+1 overlaps with the caller's processing of page N. At most two pages are held in memory at once.
+    Closing the generator (eg. breaking out of a for loop) stops any further requests.
+    :param stream: a `pysc.models.Stream`
+    :param start: datetime, read results at or after this time, defaults to the start of the stream
+    :param end: datetime, stop reading at this time (inclusive), defaults to the end of the stream
+    :param chunk_size: the maximum number of results to request per page, or an AdaptivePageSize
+    :param prefetch: download the next page while the caller works on the current one
+    :return: generator of lists of (datetime, result) tuples
+    """
+    page_size = chunk_size if hasattr(chunk_size, 'update') else _FixedPageSize(chunk_size)
+    offset = start or datetime.min
+    position = None  # the newest timestamp seen so far, the cursor
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    upcoming = None
+    try:
+        results, elapsed = _fetch_page(stream, offset, end, page_size.limit)
+        while results:
+            page_size.update(results, elapsed)
+            page = [(datetime_from_iso(r['t']), r) for r in results]
+            if position is not None:
+                # Drop the result(s) at the cursor, which were already in the previous page
+                page = [tr for tr in page if tr[0] > position]
+            if end is not None:
+                page = [tr for tr in page if tr[0] <= end]
+            if not page:
+                break
+            page.sort(key=lambda tr: tr[0])
+            position = page[-1][0]
+            finished = end is not None and position >= end
+            if not finished:
+                offset = position
+                if executor is not None:
+                    upcoming = executor.submit(_fetch_page, stream, offset, end, page_size.limit)
+            yield page
+            if finished:
+                break
+            if executor is not None:
+                results, elapsed = upcoming.result()
+            else:
+                results, elapsed = _fetch_page(stream, offset, end, page_size.limit)
+    finally:
+        if executor is not None:
+            if upcoming is not None:
+                upcoming.cancel()
+            executor.shutdown(wait=False)
+
+
+def iter_observations(stream, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE, prefetch=True):
+    """
+    Generator over the observation results on a stream, one result at a time, in time order.
+    This replaces the manual pagination loop in the get_observations_from_stream.py example. Results are read lazily,
+    a page at a time, with the next page downloaded in the background. See `iter_observation_pages()`.
+    :param stream: a `pysc.models.Stream`
+    :param start: datetime, read results at or after this time, defaults to the start of the stream
+    :param end: datetime, stop reading at this time (inclusive), defaults to the end of the stream
+    :param chunk_size: the maximum number of results to request per page, or an AdaptivePageSize
+    :param prefetch: download the next page while the caller works on the current one
+    :return: generator of (datetime, value) tuples
+    """
+    for page in iter_observation_pages(stream, start, end, chunk_size, prefetch):
+        for t, r in page:
+            yield t, unwrap_value(r['v'])
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of using `pysc` to login to a SensorCloud instance endpoint and create many streams (and the locations they
+need) from a manifest file. See the create_stream.py example for creating a single stream.
+
+The manifest is either a CSV file with a header row, or a JSON file containing a list of objects, with one stream per
+row/object. The recognised columns are:
+stream_id, name, description, organisation_id, location_id, result_type, reporting_period, sample_period,
+cumulative, interpolation_type, timezone, unit_of_measure, observed_property,
+and for creating locations which don't exist yet: location_description, lat, lon
+
+Each distinct organisation and location is checked only once. Missing locations are created first, and then the
+streams are saved concurrently, with a bounded number of workers. Every stream gets its own success or error report,
+one failure doesn't stop the rest of the rollout.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. Preferably use python 3.5 for best
+compatibility and performance. 3.6 _should_ work, but it is not tested.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import csv
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pysc.models
+from examples.util import setup_sensorcloud_basic
+from examples.metadata_cache import MetadataCache
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['MANIFEST'] = "streams.csv"  # The CSV or JSON manifest of the streams to create
+CONSTS['MAX_WORKERS'] = 8  # The maximum number of streams to save at the same time
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Defaults for optional manifest columns, these match the create_stream.py example
+DEFAULTS = {
+    'result_type': "scalar",
+    'reporting_period': "PT1H",
+    'sample_period': "PT1H",
+    'cumulative': "false",
+    'interpolation_type': "discontinuous",
+    'timezone': "",
+}
+_TRUE_STRINGS = ("true", "yes", "1")
+
+
+def load_manifest(filename):
+    """
+    Load the rows of a CSV or JSON stream manifest.
+    :param filename: path to a .csv or .json file
+    :return: list of dicts, with the defaults filled in
+    :raises ValueError: if a row is missing a required column, or a stream_id appears more than once
+    """
+    with open(filename, newline='') as f:
+        if filename.lower().endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    manifest = []
+    seen = set()
+    for row in rows:
+        item = dict(DEFAULTS)
+        item.update({k: (str(v).strip() if v is not None else "") for k, v in row.items()})
+        if not item.get('stream_id') or not item.get('organisation_id') or not item.get('location_id'):
+            raise ValueError("Every manifest row needs a stream_id, organisation_id and location_id: {:s}"
+                             .format(repr(row)))
+        if item['stream_id'] in seen:
+            raise ValueError("The stream_id {:s} appears more than once in the manifest.".format(item['stream_id']))
+        seen.add(item['stream_id'])
+        manifest.append(item)
+    return manifest
+
+
+def build_location(row):
+    """
+    Build a new (unsaved) Location from the location columns of a manifest row.
+    """
+    if not row.get('lat') or not row.get('lon'):
+        raise ValueError("Location {:s} does not exist, and the manifest does not give its lat and lon."
+                         .format(row['location_id']))
+    new_location = pysc.models.Location(row['location_id'])
+    new_location.organisation_id = row['organisation_id']
+    new_location.geo_json = pysc.models.Location.GeoJSON(lat=float(row['lat']), lon=float(row['lon']))
+    new_location.description = row.get('location_description') or row['location_id']
+    return new_location
+
+
+def build_stream(row):
+    """
+    Build a new (unsaved) Stream from a manifest row, the same way as the create_stream.py example.
+    """
+    new_stream = pysc.models.Stream(row['stream_id'])
+    new_stream.name = row.get('name') or row['stream_id']
+    new_stream.description = row.get('description') or row['stream_id']
+    new_stream.organisation_id = row['organisation_id']
+    new_stream.location_id = row['location_id']
+    new_stream.result_type = pysc.models.Stream.ResultTypes[row['result_type']].value
+    new_stream.reporting_period = row['reporting_period']
+    new_stream.sample_period = row['sample_period']
+    metadata = pysc.models.Stream.Metadata()
+    metadata.cumulative = row['cumulative'].lower() in _TRUE_STRINGS
+    metadata.interpolation_type = pysc.models.Stream.Metadata.InterpolationTypes[row['interpolation_type']].value
+    if row['timezone']:
+        metadata.timezone = row['timezone']
+    metadata.unit_of_measure = row['unit_of_measure']
+    metadata.observed_property = row['observed_property']
+    new_stream.stream_metadata = metadata
+    return new_stream
+
+
+def _ensure_location(cache, row):
+    try:
+        return cache.single(pysc.models.Location, row['location_id'])
+    except KeyError:
+        return cache.save(build_location(row))
+
+
+def _save_stream(cache, row):
+    stream = cache.save(build_stream(row))
+    assert (row['stream_id'] == stream.id)
+    return stream
+
+
+def provision(manifest, max_workers=8, cache=None):
+    """
+    Create every stream in the manifest, and any missing locations they need.
+    :param manifest: list of manifest rows, see load_manifest()
+    :param max_workers: the maximum number of requests to make at the same time
+    :param cache: a MetadataCache to use for the organisation and location checks
+    :return: list of (stream_id, error) tuples in manifest order, error is None if the stream was created
+    """
+    cache = cache or MetadataCache()
+    errors = {}  # stream_id -> error
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 1. Check each distinct organisation once
+        org_ids = sorted(set(row['organisation_id'] for row in manifest))
+        org_checks = {o: executor.submit(cache.single, pysc.models.Organisation, o) for o in org_ids}
+        org_errors = {}  # org_id -> error
+        for org_id, f in org_checks.items():
+            try:
+                f.result()
+            except KeyError:
+                org_errors[org_id] = RuntimeWarning("The organisation named {:s} was not found.".format(org_id))
+                logger.error("The organisation named {:s} was not found.".format(org_id))
+            except Exception as e:
+                org_errors[org_id] = e
+                logger.error("The organisation {:s} could not be checked: {:s}".format(org_id, repr(e)))
+        for row in manifest:
+            if row['organisation_id'] in org_errors:
+                errors[row['stream_id']] = org_errors[row['organisation_id']]
+
+        # 2. Check each distinct location once, and create the missing ones, before any of the streams
+        location_rows = {}
+        for row in manifest:
+            if row['stream_id'] not in errors:
+                location_rows.setdefault(row['location_id'], row)
+        location_checks = {l: executor.submit(_ensure_location, cache, r) for l, r in location_rows.items()}
+        for location_id, f in location_checks.items():
+            try:
+                f.result()
+            except Exception as e:
+                logger.error("The location {:s} could not be found or created: {:s}".format(location_id, repr(e)))
+                for row in manifest:
+                    if row['location_id'] == location_id:
+                        errors.setdefault(row['stream_id'], e)
+
+        # 3. Save the streams concurrently
+        saves = {row['stream_id']: executor.submit(_save_stream, cache, row)
+                 for row in manifest if row['stream_id'] not in errors}
+        for stream_id, f in saves.items():
+            try:
+                f.result()
+            except Exception as e:
+                logger.error("The stream {:s} could not be created: {:s}".format(stream_id, repr(e)))
+                errors[stream_id] = e
+    return [(row['stream_id'], errors.get(row['stream_id'])) for row in manifest]
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    # The connection pool is sized to match the number of workers.
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'], pool_size=CONSTS['MAX_WORKERS'])
+
+    manifest = load_manifest(CONSTS['MANIFEST'])
+    report = provision(manifest, max_workers=CONSTS['MAX_WORKERS'])
+    failed = 0
+    for stream_id, error in report:
+        if error is None:
+            print("Created stream: {:s}".format(stream_id))
+        else:
+            failed += 1
+            print("FAILED to create stream {:s}: {:s}".format(stream_id, str(error)))
+    print("Created {:d} of {:d} streams.".format(len(report) - failed, len(report)))
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive concurrency and rate control for the requests made on the shared session.
+
+Every example which makes requests in parallel (link following in get_streams.py, observation uploads, group sweeps)
+shares one SensorCloud server, and pushing it too hard gets 429 Too Many Requests and 5xx responses back.
+`RateController` keeps a limit on the number of requests in flight to each endpoint (scheme and host), and adjusts it
+with AIMD (additive increase, multiplicative decrease), the same way TCP sizes its congestion window:
+
+* each successful request raises the limit by 1/limit, so the limit grows by about one per round of requests
+* a 429 or 5xx response, a connection error, or a response much slower than the usual latency cuts the limit down.
+  The limit is cut at most once per round, only requests started after the last cut can cut it again.
+
+The usual latency is tracked separately for each class of request (method, collection and page size), so a large
+observation page or upload is compared with earlier ones like it, not with the small metadata requests to the same
+host.
+
+A `Retry-After` header on a 429 or 503 response pauses all new requests to that endpoint until the given time.
+Idempotent requests (GET, HEAD, PUT, DELETE, OPTIONS) which fail that way are retried, after an exponential backoff
+with full jitter. POST requests are only retried after a 429, which means the server did not act on the request.
+Callers which retry on their own, like `examples.ingest.save_batch()`, send their requests inside `no_retries()`, so
+the two layers of retries don't multiply.
+The current limits and counters are available from `snapshot()`.
+It is off by default, pass `adaptive=True` to `setup_sensorcloud_basic()` or `setup_sensorcloud_apikey()` to use it.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import email.utils
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl
+import requests
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF = 0.5  # seconds, the first retry waits up to this long, doubling for each retry after that
+DEFAULT_MAX_BACKOFF = 30.0
+MAX_RETRY_AFTER = 120.0  # never wait longer than this, whatever a Retry-After header says
+
+
+def parse_retry_after(value, now=None):
+    """
+    :param value: a Retry-After header, either a number of seconds, or an HTTP date
+    :param now: the current unix time, for the HTTP date form
+    :return: the number of seconds to wait, or None if the header is missing or not understood
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    return max(when.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+def request_class(method, url, params=None):
+    """
+    Group requests which should take about as long as each other, for the latency baselines of AdaptiveLimit.
+    Requests for a single entity (no query) are grouped by their collection, eg. 'GET /streams/*', and listings,
+    searches and observation pages by their path and the power of two above their `limit` parameter, if any.
+    :param method: the HTTP method
+    :param url: the URL, with or without a query string
+    :param params: the query parameters which are not already in the URL
+    :return: str
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    if isinstance(params, dict):
+        query.update(params)
+    if not query:
+        return "{:s} {:s}/*".format(method, parts.path.rstrip('/').rsplit('/', 1)[0])
+    try:
+        size = 1 << max(int(query['limit']) - 1, 0).bit_length()
+    except (KeyError, TypeError, ValueError):
+        return "{:s} {:s}".format(method, parts.path)
+    return "{:s} {:s}?limit<={:d}".format(method, parts.path, size)
+
+
+class AdaptiveLimit(object):
+    """
+    The AIMD in-flight request limit for one endpoint.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, decrease=0.5, latency_decrease=0.9, latency_tolerance=3.0,
+                 clock=time.monotonic):
+        """
+        :param initial: the starting limit
+        :param minimum: the limit is never cut below this
+        :param maximum: the limit never grows above this, eg. the size of the connection pool
+        :param decrease: the factor the limit is cut by after a 429, 5xx or connection error
+        :param latency_decrease: the gentler factor the limit is cut by after a response which was too slow
+        :param latency_tolerance: a response is too slow when it takes this many times the baseline latency
+        :param clock: the time source, in seconds
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.decrease = decrease
+        self.latency_decrease = latency_decrease
+        self.latency_tolerance = latency_tolerance
+        self._clock = clock
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.baselines = {}  # request class -> a slowly drifting minimum of the observed latency
+        self._last_cut = float('-inf')
+        self._paused_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.cuts = 0
+
+    def acquire(self):
+        """
+        Wait for a free slot, and take it.
+        :return: the start time, to pass back to release()
+        """
+        with self._cond:
+            while True:
+                wait = self._paused_until - self._clock()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+            return self._clock()
+
+    def pause(self, seconds):
+        """
+        Stop handing out slots for the given number of seconds, eg. for a Retry-After header.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + min(seconds, MAX_RETRY_AFTER))
+
+    def _cut(self, started, factor):
+        # Responses to requests sent before the last cut were already counted in it
+        if started > self._last_cut:
+            self.limit = max(self.limit * factor, float(self.minimum))
+            self._last_cut = self._clock()
+            self.cuts += 1
+
+    def release(self, started, status=None, error=False, request_class=None):
+        """
+        Give back a slot, and adjust the limit from the outcome of the request.
+        :param started: the time returned by acquire()
+        :param status: the HTTP status code of the response
+        :param error: True if the request failed without a response, eg. a connection error or timeout
+        :param request_class: the requests whose latency this one is compared with, see `request_class()`
+        """
+        with self._cond:
+            self.in_flight -= 1
+            elapsed = self._clock() - started
+            if error or status in RETRY_STATUSES:
+                if status == 429:
+                    self.throttled += 1
+                else:
+                    self.errors += 1
+                self._cut(started, self.decrease)
+            else:
+                self.successes += 1
+                baseline = self.baselines.get(request_class)
+                if baseline is None or elapsed < baseline:
+                    baseline = elapsed
+                else:
+                    baseline += (elapsed - baseline) * 0.01
+                self.baselines[request_class] = baseline
+                if elapsed > baseline * self.latency_tolerance and elapsed > 0.05:
+                    self._cut(started, self.latency_decrease)
+                else:
+                    self.limit = min(self.limit + 1.0 / self.limit, float(self.maximum))
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight, 'baselines_s': dict(self.baselines),
+                    'paused_s': max(self._paused_until - self._clock(), 0.0), 'successes': self.successes,
+                    'throttled': self.throttled, 'errors': self.errors, 'cuts': self.cuts}
+
+
+class RateController(object):
+    """
+    Shares an AdaptiveLimit per endpoint between every request made through it, and retries failed requests.
+    See `PooledSession` in examples.util, which sends every request through one of these when it is given one.
+    """
+
+    def __init__(self, initial=4, maximum=64, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF, sleep=time.sleep, **limit_kwargs):
+        """
+        :param initial: the starting in-flight limit for each endpoint
+        :param maximum: the largest in-flight limit for each endpoint, eg. the size of the connection pool
+        :param max_retries: the number of times a failed request is retried
+        :param backoff: the base backoff in seconds, see the module docs
+        :param max_backoff: the longest backoff in seconds
+        :param sleep: the function used to wait before a retry
+        :param limit_kwargs: passed on to each AdaptiveLimit
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        self._limit_kwargs = limit_kwargs
+        self._lock = threading.Lock()
+        self._limits = {}  # endpoint -> AdaptiveLimit
+        self.retries = 0
+        self.on_retry = None  # optional callable(method, url), called before each retry
+        self._local = threading.local()
+
+    def limit_for(self, url):
+        parts = urlsplit(url)
+        endpoint = "{:s}://{:s}".format(parts.scheme, parts.netloc)
+        with self._lock:
+            limit = self._limits.get(endpoint)
+            if limit is None:
+                limit = self._limits[endpoint] = AdaptiveLimit(self.initial, maximum=self.maximum,
+                                                               **self._limit_kwargs)
+            return limit
+
+    @contextmanager
+    def no_retries(self):
+        """
+        Requests made from this thread inside this block are sent only once, for callers which retry on their own.
+        The in-flight limit and Retry-After pauses still apply.
+        """
+        previous = getattr(self._local, 'no_retries', False)
+        self._local.no_retries = True
+        try:
+            yield
+        finally:
+            self._local.no_retries = previous
+
+    def _should_retry(self, method, status, error):
+        if method in IDEMPOTENT_METHODS:
+            return error or status in RETRY_STATUSES
+        return status == 429
+
+    def _backoff(self, attempt):
+        # "Full jitter", spreads the retries of many workers out, rather than having them all retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request(self, send, method, url, **kwargs):
+        """
+        Send a request within the endpoint's in-flight limit, retrying it if it fails and is safe to retry.
+        :param send: callable(method, url, **kwargs) which makes the request and returns a `requests.Response`
+        :return: the `requests.Response` of the last attempt. A connection error on the last attempt is raised.
+        """
+        method = method.upper()
+        limit = self.limit_for(url)
+        key = request_class(method, url, kwargs.get('params'))
+        max_retries = 0 if getattr(self._local, 'no_retries', False) else self.max_retries
+        attempt = 0
+        while True:
+            started = limit.acquire()
+            try:
+                response = send(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                limit.release(started, error=True, request_class=key)
+                if attempt >= max_retries or not self._should_retry(method, None, True):
+                    raise
+                response = None
+            else:
+                limit.release(started, response.status_code, request_class=key)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    limit.pause(retry_after)
+                if attempt >= max_retries or not self._should_retry(method, response.status_code, False):
+                    return response
+                response.close()
+            wait = self._backoff(attempt)
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            if self.on_retry is not None:
+                self.on_retry(method, url)
+            self._sleep(wait)
+
+    def snapshot(self):
+        """
+        :return: dict of endpoint -> the current limit and counters of that endpoint, plus the total 'retries'
+        """
+        with self._lock:
+            limits = dict(self._limits)
+            retries = self.retries
+        return {'retries': retries, 'endpoints': {k: v.snapshot() for k, v in sorted(limits.items())}}
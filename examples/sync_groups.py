@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Example of using `pysc` to login to a SensorCloud instance endpoint and reconcile the Groups in your organisation
+with a desired set of groups, creating, updating and deleting groups as needed.
+
+The create_group.py and delete_group.py examples handle one group at a time, with several round trips for each.
+Here the existing groups are read with a single `Group.resolve_all()` listing, the changes are made concurrently,
+and the result is verified with one more listing, rather than a `Group.single()` check per group.
+
+Note, the `pysc` lib, (and by extension these examples) require python 3.4 or above. Preferably use python 3.5 for best
+compatibility and performance. 3.6 _should_ work, but it is not tested.
+"""
+__author__ = "Ashley Sommer"
+__copyright__ = "Copyright 2017, CSIRO Land and Water"
+
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pysc.models
+from examples.util import setup_sensorcloud_basic
+
+MODULE = sys.modules[__name__]
+CONSTS = MODULE.CONSTS = dict()
+
+# Define the Endpoint, Username, and Password for use within this file.
+CONSTS['SC_ENDPOINT'] = "https://sensor-cloud.io/api/sensor/v2"
+CONSTS['SC_USERNAME'] = "your.user@example.com"
+CONSTS['SC_PASSWORD'] = "password"
+CONSTS['PYSC_DEBUG'] = True
+
+# Define some constants we will use for this example
+CONSTS['ORG_ID'] = "csiro"  # This must be an organisation defined on the SensorCloud endpoint beforehand.
+# The groups that should exist in the organisation, group id -> (name, description)
+CONSTS['DESIRED_GROUPS'] = {
+    "mygroup": ("My New Group", "Example of creating a new Group within my organisation in SensorCloud"),
+}
+# If True, groups in the organisation which are not in DESIRED_GROUPS are deleted.
+# NOTE! We cannot delete a group that is assigned to any users or groups or anything.
+CONSTS['DELETE_EXTRA'] = False
+CONSTS['MAX_WORKERS'] = 8  # The maximum number of groups to create or delete at the same time
+# Set up logging for this example file
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def list_groups(org_id):
+    """
+    :param org_id: str
+    :return: dict of group id -> Group, for every group in the organisation, from one listing
+    """
+    return {g.id: g for g in pysc.models.Group.resolve_all(params={'organisation_id': org_id})}
+
+
+def plan(existing, desired, delete_extra=False):
+    """
+    Work out the changes needed to turn the existing groups into the desired groups.
+    :param existing: dict of group id -> Group
+    :param desired: dict of group id -> (name, description)
+    :param delete_extra: also delete existing groups which are not desired
+    :return: tuple of (ids to create, ids to update, ids to delete), each sorted
+    """
+    to_create = sorted(set(desired) - set(existing))
+    to_update = sorted(i for i in set(desired) & set(existing)
+                       if (existing[i].name, existing[i].description) != tuple(desired[i]))
+    to_delete = sorted(set(existing) - set(desired)) if delete_extra else []
+    return to_create, to_update, to_delete
+
+
+def _matches(group, org_id, name, description):
+    # True if a listed group has the desired state
+    return (group.organisation_id, group.name, group.description) == (org_id, name, description)
+
+
+def _save_group(org_id, group_id, name, description):
+    new_group = pysc.models.Group(group_id)
+    new_group.name = name
+    new_group.description = description
+    new_group.organisation_id = org_id
+    # If there was already a group with the same id on SensorCloud, the existing one will be overwritten (updated).
+    group = new_group.save()
+    assert (group_id == group.id)
+    return group
+
+
+def _delete_group(group_id):
+    # the second argument is `cascade`, we don't want to do that here.
+    pysc.models.Group.delete(group_id, False)
+
+
+def sync_groups(org_id, desired, delete_extra=False, max_workers=8):
+    """
+    Reconcile the groups in an organisation with a desired set of groups.
+    This takes one listing, one request per group that needs to change, and one more listing to verify the result.
+    :param org_id: str
+    :param desired: dict of group id -> (name, description)
+    :param delete_extra: also delete existing groups which are not desired
+    :param max_workers: the maximum number of changes to make at the same time
+    :return: dict with lists of the 'created', 'updated' and 'deleted' group ids, a dict of 'errors' keyed by group
+             id, and a list of 'unverified' group ids whose change did not show up in the verification listing. A
+             created or updated group is only verified if its organisation, name and description all match.
+    """
+    existing = list_groups(org_id)
+    to_create, to_update, to_delete = plan(existing, desired, delete_extra)
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for group_id in to_create + to_update:
+            name, description = desired[group_id]
+            futures[group_id] = executor.submit(_save_group, org_id, group_id, name, description)
+        for group_id in to_delete:
+            futures[group_id] = executor.submit(_delete_group, group_id)
+        for group_id, f in futures.items():
+            try:
+                f.result()
+            except Exception as e:
+                logger.error("Changing group {:s} failed: {:s}".format(group_id, repr(e)))
+                errors[group_id] = e
+
+    # Verify every change with a single listing, rather than a Group.single() call per group
+    after = list_groups(org_id) if (to_create or to_update or to_delete) else existing
+    unverified = set(i for i in to_create + to_update
+                     if i not in errors and (i not in after or not _matches(after[i], org_id, *desired[i])))
+    unverified.update(i for i in to_delete if i not in errors and i in after)
+    return {
+        'created': [i for i in to_create if i not in errors and i not in unverified],
+        'updated': [i for i in to_update if i not in errors and i not in unverified],
+        'deleted': [i for i in to_delete if i not in errors and i not in unverified],
+        'errors': errors,
+        'unverified': sorted(unverified),
+    }
+
+
+def main():
+    """
+    Entrypoint for this example application
+    :return:
+    """
+
+    # Setup `pysc` to use BASIC auth, with a username, and password. Also sets the endpoint to use.
+    # The connection pool is sized to match the number of workers.
+    setup_sensorcloud_basic(CONSTS['SC_USERNAME'], CONSTS['SC_PASSWORD'],
+                            CONSTS['SC_ENDPOINT'], CONSTS['PYSC_DEBUG'], pool_size=CONSTS['MAX_WORKERS'])
+
+    org_id = CONSTS['ORG_ID']
+    # Ensure the organisation exists on the SensorCloud endpoint.
+    try:
+        organisation = pysc.models.Organisation.single(org_id)
+    except KeyError:
+        raise RuntimeWarning("""The organisation named {:s} was not found.\n""".format(org_id))
+    # Ensure sanity, check we got the organisation that we asked for.
+    assert (org_id == organisation.id)
+
+    result = sync_groups(org_id, CONSTS['DESIRED_GROUPS'], CONSTS['DELETE_EXTRA'], CONSTS['MAX_WORKERS'])
+    for action in ('created', 'updated', 'deleted'):
+        for group_id in result[action]:
+            print("Group {:s} was {:s}.".format(group_id, action))
+    for group_id, error in sorted(result['errors'].items()):
+        print("FAILED to change group {:s}: {:s}".format(group_id, str(error)))
+    for group_id in result['unverified']:
+        print("Group {:s} was changed, but the change was not seen in the verification listing.".format(group_id))
+    # Final sanity check, everything we changed shows up in the verification listing
+    assert not result['unverified']
+
+# script execution entrypoint
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,112 @@
 A collection of utility functions to share common functionality between the examples
 """
 
+import base64
 import datetime
+import re
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+import haleasy
 import pysc.settings
 import pysc.models
+from examples.rate_control import RateController
+
+# The fixed-width layout SensorCloud uses for timestamps, eg. "2017-01-01T00:00:00.000000Z"
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+_ISO_LENGTH = 27
+_ISO_VARIANT = re.compile(r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,9}))?"
+                          r"(Z|[+-]\d{2}:?\d{2})?$")
+
+# Defaults for the shared HTTP session, see install_session()
+DEFAULT_POOL_SIZE = 10  # Size this to at least the number of concurrent workers making requests
+DEFAULT_TIMEOUT = (10.0, 120.0)  # (connect, read) timeouts in seconds
+DEFAULT_ETAG_ENTRIES = 1024  # The number of GET responses kept for conditional revalidation
+ETAG_MAX_BODY = 64 * 1024  # Only keep small (metadata sized) responses for conditional revalidation
+
+# The shared session and endpoint set up by setup_sensorcloud_basic() or setup_sensorcloud_apikey()
+_SESSION = None
+_ENDPOINT = None
+_INSTRUMENTATION = None
+_CONTROLLER = None
+_ORIGINAL_HAL_REQUEST = haleasy.HALHttpClient.__dict__['request']
 
 
 def datetime_to_iso(_d):
-    return _d.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    """
+    Encode a datetime into the fixed-width SensorCloud timestamp layout.
+    A timezone aware datetime is converted to UTC first, naive datetimes are assumed to already be in UTC.
+    :param _d: datetime
+    :return: str, eg. "2017-01-01T00:00:00.000000Z"
+    """
+    if _d.tzinfo is not None:
+        _d = _d.astimezone(datetime.timezone.utc)
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%06dZ" % (_d.year, _d.month, _d.day,
+                                                    _d.hour, _d.minute, _d.second, _d.microsecond)
+
+
+def _datetime_from_iso_variant(_d):
+    m = _ISO_VARIANT.match(_d)
+    if m is None:
+        raise ValueError("time data {:s} is not a recognised ISO8601 timestamp".format(repr(_d)))
+    year, month, day, hour, minute, second, fraction, offset = m.groups()
+    # Fractional seconds may have any number of digits, we keep microsecond precision
+    microsecond = int((fraction or "0")[:6].ljust(6, "0"))
+    d = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond)
+    if offset and offset != "Z":
+        offset = offset.replace(":", "")
+        delta = datetime.timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        # Normalise to a naive UTC datetime, to match the fixed-width layout
+        d = d - delta if offset[0] == "+" else d + delta
+    return d
 
 
 def datetime_from_iso(_d):
-    return datetime.datetime.strptime(_d, "%Y-%m-%dT%H:%M:%S.%fZ")
+    """
+    Decode a SensorCloud timestamp into a naive UTC datetime.
+    The fixed-width layout "2017-01-01T00:00:00.000000Z" is decoded by slicing, which is much faster than strptime.
+    Other variants the server can return, such as no fractional seconds, or a "+00:00" offset, are also accepted.
+    :param _d: str
+    :return: datetime
+    """
+    if len(_d) == _ISO_LENGTH and _d[19] == "." and _d[26] == "Z":
+        return datetime.datetime(int(_d[0:4]), int(_d[5:7]), int(_d[8:10]),
+                                 int(_d[11:13]), int(_d[14:16]), int(_d[17:19]), int(_d[20:26]))
+    return _datetime_from_iso_variant(_d)
+
+
+def datetimes_to_iso(_ds):
+    """
+    Encode a batch of timestamps into the fixed-width SensorCloud timestamp layout.
+    :param _ds: a sequence of datetimes, or a numpy datetime64 array
+    :return: list of str, or a numpy str array if a numpy array was given
+    """
+    if getattr(_ds, 'dtype', None) is not None and _ds.dtype.kind == 'M':
+        import numpy as np
+        return np.char.add(np.datetime_as_string(_ds.astype('datetime64[us]'), unit='us'), "Z")
+    return [datetime_to_iso(d) for d in _ds]
+
+
+def datetimes_from_iso(_ds, as_numpy=False):
+    """
+    Decode a batch of SensorCloud timestamps.
+    :param _ds: a sequence of timestamp strings
+    :param as_numpy: return a numpy datetime64[us] array rather than a list of datetimes
+    :return: list of naive UTC datetimes, or a numpy datetime64[us] array
+    """
+    if not as_numpy:
+        return [datetime_from_iso(d) for d in _ds]
+    import numpy as np
+    try:
+        # numpy can parse the whole batch at once if every timestamp is in the fixed-width layout
+        if all(len(d) == _ISO_LENGTH and d[26] == "Z" for d in _ds):
+            return np.array([d[:26] for d in _ds], dtype='datetime64[us]')
+    except ValueError:
+        pass
+    return np.array([datetime_from_iso(d) for d in _ds], dtype='datetime64[us]')
 
 
 def create_organisation(organisation_id, name):
@@ -23,8 +118,274 @@ def create_organisation(organisation_id, name):
     org = org.save()
     assert org is not None, "Organisation {:s} could not be created.".format(organisation_id)
 
-def setup_sensorcloud_basic(username, password, endpoint, debug=False):
+class CachedBasicAuth(AuthBase):
+    """
+    HTTP Basic auth which builds the Authorization header once, rather than on every request.
+    """
+
+    def __init__(self, username, password):
+        credentials = "{:s}:{:s}".format(username, password).encode('latin1')
+        self.header = "Basic " + base64.b64encode(credentials).decode('ascii')
+
+    def __call__(self, r):
+        r.headers['Authorization'] = self.header
+        return r
+
+
+class ApiKeyAuth(AuthBase):
+    """
+    SensorCloud API key auth, sent in the Authorization header of every request on the shared session.
+    """
+
+    def __init__(self, apikey):
+        self.header = "apikey " + apikey
+
+    def __call__(self, r):
+        r.headers['Authorization'] = self.header
+        return r
+
+
+def _url_path(url):
+    return url.split('?', 1)[0].rstrip('/')
+
+
+class ETagStore(object):
+    """
+    A thread-safe LRU store of GET responses which carried an ETag, keyed by url.
+    """
+
+    def __init__(self, max_entries=DEFAULT_ETAG_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def invalidate(self, url):
+        """
+        Forget the responses for a url that is being written to, and for its parent collection (index) url.
+        """
+        path = _url_path(url)
+        parent = path.rsplit('/', 1)[0]
+        with self._lock:
+            for key in [k for k in self._responses if _url_path(k) in (path, parent)]:
+                del self._responses[key]
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+
+
+class PooledSession(requests.Session):
+    """
+    A `requests.Session` with a sized, keep-alive connection pool and a default timeout on every request.
+    One of these is shared between every `pysc` request, so connections (and their TLS handshakes) are reused.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, auth=None, revalidate=False,
+                 controller=None):
+        """
+        :param pool_size: the maximum number of connections kept alive per host, size it for your concurrent workers
+        :param timeout: the default (connect, read) timeout in seconds
+        :param auth: a requests auth object, eg. CachedBasicAuth
+        :param revalidate: keep small GET responses which carry an ETag, and revalidate them with If-None-Match.
+                           A 304 Not Modified response is answered with the kept response.
+        :param controller: an examples.rate_control.RateController, to limit the requests in flight and retry failed
+                           requests
+        """
+        super(PooledSession, self).__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.headers.update(haleasy.HALHttpClient.DEFAULT_HEADERS)
+        self.auth = auth
+        self.etags = ETagStore() if revalidate else None
+        self.controller = controller
+        self.instrumentation = None  # set to an examples.instrumentation.Instrumentation to record every request
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        controller = self.controller
+        if controller is None:
+            return self._send(method, url, **kwargs)
+        return controller.request(self._send, method, url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._request(method, url, **kwargs)
+        started = time.perf_counter()
+        try:
+            response = self._request(method, url, **kwargs)
+        except Exception:
+            instrumentation.record_http(time.perf_counter() - started, error=True)
+            raise
+        if kwargs.get('stream'):
+            # Don't read a streamed body here, that is up to the caller
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        instrumentation.record_http(time.perf_counter() - started, response.status_code, size)
+        return response
+
+    def _request(self, method, url, **kwargs):
+        etags = self.etags
+        if etags is None or kwargs.get('stream'):
+            # A streamed body is read by the caller, it can't be kept for revalidation
+            return super(PooledSession, self).request(method, url, **kwargs)
+        if method.upper() != 'GET':
+            # Anything we kept for this url is stale once it has been written to
+            etags.invalidate(url)
+            return super(PooledSession, self).request(method, url, **kwargs)
+        key = url
+        if kwargs.get('params'):
+            key = "{:s}?{:s}".format(url, repr(sorted(dict(kwargs['params']).items())))
+        kept = etags.get(key)
+        if kept is not None:
+            headers = dict(kwargs.get('headers') or {})
+            headers['If-None-Match'] = kept.headers['ETag']
+            kwargs['headers'] = headers
+        response = super(PooledSession, self).request(method, url, **kwargs)
+        if response.status_code == 304 and kept is not None:
+            return kept
+        if response.status_code == 200 and 'ETag' in response.headers and len(response.content) <= ETAG_MAX_BODY:
+            etags.put(key, response)
+        return response
+
+
+def install_session(session):
+    """
+    Make every `pysc`/`haleasy` request use the given session, unless the caller passes a session of its own.
+    Without this, `haleasy` creates a new session, and so a new connection, for every request.
+    :param session: a `requests.Session`, or None to go back to a new session per request
+    """
+    global _SESSION
+    _SESSION = session
+    if session is None:
+        haleasy.HALHttpClient.request = _ORIGINAL_HAL_REQUEST
+        return
+    original = _ORIGINAL_HAL_REQUEST.__func__
+
+    def request(cls, url, method=None, data=None, session=None, **kwargs):
+        if session is None:
+            session = _SESSION
+            if session.auth is not None:
+                # The shared session already carries the credentials, don't build them again for each request
+                kwargs.pop('auth', None)
+        return original(cls, url, method=method, data=data, session=session, **kwargs)
+    haleasy.HALHttpClient.request = classmethod(request)
+
+
+def get_session():
+    """
+    :return: the shared session set up by setup_sensorcloud_basic() or setup_sensorcloud_apikey(), or None
+    """
+    return _SESSION
+
+
+def require_session():
+    """
+    For the helpers which make their own requests on the shared session, rather than through `pysc`.
+    :return: the shared session
+    :raises RuntimeError: if there is no shared session, or it carries no credentials
+    """
+    if _SESSION is None or _SESSION.auth is None:
+        raise RuntimeError("This needs the shared, authenticated session, use setup_sensorcloud_basic() or "
+                           "setup_sensorcloud_apikey() with pooled=True.")
+    return _SESSION
+
+
+def get_endpoint():
+    """
+    :return: the SensorCloud endpoint set up by setup_sensorcloud_basic() or setup_sensorcloud_apikey(), or None
+    """
+    return _ENDPOINT
+
+
+def get_instrumentation():
+    """
+    :return: the Instrumentation set up by setup_sensorcloud_basic() or setup_sensorcloud_apikey() with
+             instrument=True, or None when instrumentation is off
+    """
+    return _INSTRUMENTATION
+
+
+def get_rate_controller():
+    """
+    :return: the RateController set up by setup_sensorcloud_basic() or setup_sensorcloud_apikey() with
+             adaptive=True, or None. Its snapshot() has the current in-flight limits.
+    """
+    return _CONTROLLER
+
+
+def _setup_session(auth, pooled, pool_size, timeout, revalidate, instrument, adaptive):
+    global _INSTRUMENTATION, _CONTROLLER
+    _CONTROLLER = RateController(initial=max(pool_size // 2, 1), maximum=pool_size) if pooled and adaptive else None
+    session = None
+    if pooled:
+        session = PooledSession(pool_size, timeout, auth=auth, revalidate=revalidate, controller=_CONTROLLER)
+    install_session(session)
+    if instrument:
+        from examples import instrumentation
+        _INSTRUMENTATION = instrumentation.Instrumentation()
+        instrumentation.install(_INSTRUMENTATION)
+        if session is not None:
+            session.instrumentation = _INSTRUMENTATION
+        if _CONTROLLER is not None:
+            _CONTROLLER.on_retry = lambda method, url: _INSTRUMENTATION.record_retry()
+    elif _INSTRUMENTATION is not None:
+        from examples import instrumentation
+        instrumentation.uninstall()
+        _INSTRUMENTATION = None
+
+
+def setup_sensorcloud_basic(username, password, endpoint, debug=False, pooled=True, pool_size=DEFAULT_POOL_SIZE,
+                            timeout=DEFAULT_TIMEOUT, revalidate=False, instrument=False, adaptive=False):
+    """
+    Set up `pysc` to use BASIC auth with the given endpoint.
+    By default this also sets up one shared, keep-alive HTTP session for all `pysc` requests, with the auth header
+    built once. Use a pool_size at least as large as the number of workers making requests at the same time.
+    :param pooled: set to False to keep the `haleasy` default of a new connection per request
+    :param revalidate: revalidate repeated GET requests with ETags, see PooledSession
+    :param instrument: record timings and counters for every API call, see get_instrumentation().
+                       HTTP requests are only recorded when pooled is True.
+    :param adaptive: opt in to limiting the requests in flight with AIMD, honouring Retry-After, and retrying failed
+                     idempotent requests, see get_rate_controller(). Only applies when pooled is True.
+    """
+    global _ENDPOINT
+    _ENDPOINT = endpoint.rstrip('/')
     pysc.settings.load({'username': username, 'password': password, 'endpoint': endpoint, 'DEBUG_MODE': debug})
+    _setup_session(CachedBasicAuth(username, password), pooled, pool_size, timeout, revalidate, instrument, adaptive)
+
 
-def setup_sensorcloud_apikey(apikey, endpoint, debug=False):
+def setup_sensorcloud_apikey(apikey, endpoint, debug=False, pooled=True, pool_size=DEFAULT_POOL_SIZE,
+                             timeout=DEFAULT_TIMEOUT, revalidate=False, instrument=False, adaptive=False):
+    """
+    Set up `pysc` to use an API key with the given endpoint.
+    By default this also sets up one shared, keep-alive HTTP session for all `pysc` requests, which sends the API key
+    with every request, including the ones made on the session directly, see require_session().
+    :param pooled: set to False to keep the `haleasy` default of a new connection per request
+    :param revalidate: revalidate repeated GET requests with ETags, see PooledSession
+    :param instrument: record timings and counters for every API call, see get_instrumentation().
+                       HTTP requests are only recorded when pooled is True.
+    :param adaptive: opt in to limiting the requests in flight with AIMD, honouring Retry-After, and retrying failed
+                     idempotent requests, see get_rate_controller(). Only applies when pooled is True.
+    """
+    global _ENDPOINT
+    _ENDPOINT = endpoint.rstrip('/')
     pysc.settings.load({'apikey': apikey, 'endpoint': endpoint, 'DEBUG_MODE': debug})
+    _setup_session(ApiKeyAuth(apikey), pooled, pool_size, timeout, revalidate, instrument, adaptive)